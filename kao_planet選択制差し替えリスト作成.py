@@ -14,10 +14,32 @@ import pandas as pd
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Excelの高速読み込み用（Rust製のcalamine）。無ければopenpyxlで読み込む
+try:
+    import python_calamine
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+    print("⚠️ python-calamineが見つかりません。Excelはopenpyxlで読み込みます（少し遅くなります）。")
+
+# 文字列列をArrow形式で扱うライブラリ。無ければ通常の文字列型で処理
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
 
 # --- 0. 設定と初期化 ---
 ROOT_DIR = Path(os.path.expanduser("~"))/"C:/Users/337475/Box/D0RM_RM_130_リテールテクノロジー研究部/新/103_棚割/002_Allo/001_社内/009_差し替えリスト関連/001_kao・planetリスト作成/03_アウトプット"
 
+# Excelを並列に読み込むときの最大スレッド数
+MAX_LOAD_WORKERS = 4
+
+# 文字列の判定・整形に使う型（Arrow形式ならC実装の演算でまとめて処理できる）
+STRING_DTYPE = 'string[pyarrow]' if PYARROW_AVAILABLE else 'string'
+
 # --- GUIでファイルを選択する関数 ---
 def select_files(title, filetypes, multiple=False):
     root = tk.Tk()
@@ -46,6 +68,7 @@ def select_output_folder(title="結果を保存するフォルダを選択して
 def load_with_repair(path, **kwargs):
     """
     Excelファイルを読み込む。エラー時は修復を試みる。
+    calamineが使える場合はcalamineで読み込み、失敗したらopenpyxlで再試行する。
     
     Parameters
     ----------
@@ -60,8 +83,11 @@ def load_with_repair(path, **kwargs):
         読み込んだデータ
     """
     try:
-        # 通常読み込み
-        df = pd.read_excel(path, **kwargs)
+        # 通常読み込み（calamineがあれば高速なcalamineで）
+        if CALAMINE_AVAILABLE and 'engine' not in kwargs:
+            df = pd.read_excel(path, engine='calamine', **kwargs)
+        else:
+            df = pd.read_excel(path, **kwargs)
         return df
     except Exception as e:
         print(f"⚠️ 読み込みエラー（修復試行中）: {path.name}")
@@ -90,7 +116,7 @@ def load_kao(path):
     )
     df.columns = ['新商品名', '新JAN', '旧JAN', '旧商品名']
     df = df.dropna(subset=['旧JAN', '新JAN'])[['旧JAN', '旧商品名', '新JAN', '新商品名']]
-    df['備考'] = path.name
+    df['新JAN備考'] = path.name
     df['データソース'] = '花王'
     return df
 
@@ -115,13 +141,17 @@ def clean_planet(df, mode):
 
 # --- 3. 純粋新規品抽出 ---
 def extract_unmatched(new_df, old_df):
-    add = new_df[~new_df['新JAN'].isin(old_df['旧JAN'])].copy()
-    add['旧商品名'] = ''
+    # 旧JANは重複を除いたIndex（ハッシュ表）にしてから照合
+    # 旧商品名は空文字（assignで追加するので、抽出結果を.copy()しなくてよい）
+    add = new_df[~new_df['新JAN'].isin(pd.Index(old_df['旧JAN'].unique()))].assign(旧商品名='')
     return add[['旧JAN', '旧商品名', '新JAN', '新商品名']]
 
 # --- 4. クレンジング前除外処理 ---
 def exclude_kao(df, is_kao_col):
-    return df[~df[is_kao_col].astype(str).str.startswith('4901301') & ~df[is_kao_col].astype(str).str.contains('花王株式会社')]
+    # メーカー列は1回だけ文字列型に変換し、2つの条件を1つのマスクで判定（正規表現は使わない）
+    makers = df[is_kao_col].astype(STRING_DTYPE)
+    is_kao = makers.str.startswith('4901301') | makers.str.contains('花王株式会社', regex=False)
+    return df[~is_kao.fillna(False)]
 
 # --- 5. プラネット差し替えリスト生成（修復機能付き） ---
 def process_planet_diff(planet_paths_dict):
@@ -141,21 +171,29 @@ def process_planet_diff(planet_paths_dict):
         date_str = pd.Timestamp(mtime, unit='s').strftime('%Y/%m/%d %H:%M')
         print(f"  {i}. {season} (ファイル日付: {date_str})")
     
+    # 全期間の新規品・廃番品ファイルを、先にまとめてスレッドで並列に読み込む
+    # （読み込みエラーは下のループで期間ごとに受け取る）
+    futures = {}
+    with ThreadPoolExecutor(max_workers=MAX_LOAD_WORKERS) as executor:
+        for season, paths in sorted_seasons:
+            if 'new' in paths and 'disc' in paths:
+                futures[season] = (
+                    executor.submit(load_with_repair, paths['new'],
+                                    dtype={'ＪＡＮコード': str, '旧ＪＡＮコード': str}),
+                    executor.submit(load_with_repair, paths['disc'],
+                                    dtype={'JANコード': str, '新JANコード': str, '廃番予定品': str, '新商品名': str}),
+                )
+    
     for season, paths in sorted_seasons:
         # 新規品と廃番品の両方が揃っている場合のみ処理
-        if 'new' not in paths or 'disc' not in paths:
+        if season not in futures:
             print(f"⚠️ {season}のプラネットデータが不完全です（スキップ）")
             continue
         
         try:
-            new_df = load_with_repair(
-                paths['new'],
-                dtype={'ＪＡＮコード': str, '旧ＪＡＮコード': str}
-            )
-            disc_df = load_with_repair(
-                paths['disc'],
-                dtype={'JANコード': str, '新JANコード': str, '廃番予定品': str, '新商品名': str}
-            )
+            new_future, disc_future = futures[season]
+            new_df = new_future.result()
+            disc_df = disc_future.result()
 
             new_df['備考'] = paths['new'].name
             disc_df['備考'] = paths['disc'].name
@@ -166,13 +204,17 @@ def process_planet_diff(planet_paths_dict):
             new_clean = clean_planet(new_df, 'new')
             disc_clean = clean_planet(disc_df, 'discontinue')
 
+            # 新規品リストの新JAN・旧JANは、重複を除いたIndex（ハッシュ表）にしてから照合
+            new_jan_index = pd.Index(new_clean['新JAN'].unique())
+            old_jan_index = pd.Index(new_clean['旧JAN'].unique())
+
             disc_not_in_new_by_new_jan = disc_clean[
-                ~disc_clean['新JAN'].isin(new_clean['新JAN'])
-            ].copy()
+                ~disc_clean['新JAN'].isin(new_jan_index)
+            ]
 
             final_disc_additions = disc_not_in_new_by_new_jan[
-                ~disc_not_in_new_by_new_jan['旧JAN'].isin(new_clean['旧JAN'])
-            ].copy()
+                ~disc_not_in_new_by_new_jan['旧JAN'].isin(old_jan_index)
+            ]
 
             pure_new_items = extract_unmatched(new_clean, disc_clean)
             combined_planet_diff = pd.concat([pure_new_items, final_disc_additions], ignore_index=True)
@@ -191,7 +233,7 @@ def process_planet_diff(planet_paths_dict):
             continue
     
     if result:
-        return pd.concat(result, ignore_index=True)
+        return pd.concat(result, ignore_index=True, copy=False)
     else:
         return pd.DataFrame()
 
@@ -201,15 +243,15 @@ def finalize(df):
     df = df.rename(columns={'旧JAN': '旧JANコード', '新JAN': '新JANコード'})
     
     for col in ['旧JANコード', '新JANコード']:
-        df[col] = (df[col].astype(str)
-                            .str.replace(r'\D+', '', regex=True)
-                            .replace('', pd.NA)
-                            .apply(lambda x: str(x).zfill(13)[:13] if pd.notna(x) else pd.NA)) 
+        # 文字列型のまま一括処理（NFKCで全角数字を半角に → 半角数字以外を除去 → 空は欠損 → 13桁に0埋めして切り出し）
+        jan = df[col].astype(STRING_DTYPE).str.normalize('NFKC').str.replace('[^0-9]+', '', regex=True)
+        df[col] = jan.mask(jan == '').str.zfill(13).str.slice(0, 13)
 
     df['旧商品名'] = df['旧商品名'].replace('', '該当文字列なし')
     df['新商品名'] = df['新商品名'].replace('', '該当文字列なし')
 
-    return df[df['旧JANコード'] != df['新JANコード']].drop_duplicates()
+    # 欠損値同士の比較は欠損になるので、従来通り「異なる」（残す）扱いにする
+    return df[(df['旧JANコード'] != df['新JANコード']).fillna(True)].drop_duplicates()
 
     # ★★★ ここでカラム順を制御 ★★★
     output_columns = ['データソース', '旧JANコード', '旧商品名', '新JANコード', '新商品名', '新JAN備考']
@@ -287,7 +329,8 @@ def main():
         messagebox.showinfo("デフォルト保存", f"デフォルト保存先: {output_dir}")
 
     # --- データ処理開始 ---
-    combined_df = pd.DataFrame()
+    # 花王・プラネットの結果はリストに集めて、最後に1回だけ結合する（途中で結合すると毎回全データをコピーするため）
+    frames = []
 
  # 花王データ処理
     if all_kao_file_paths:
@@ -307,22 +350,23 @@ def main():
             date_str = pd.Timestamp(mtime, unit='s').strftime('%Y/%m/%d %H:%M')
             print(f"  {i}. {path.name} (ファイル日付: {date_str})")
         
-        # ★★★ ソート済みのリストで処理 ★★★
-        kao_df = pd.concat([load_kao(p) for p in sorted_kao_paths], ignore_index=True)
-        kao_df = kao_df.rename(columns={'備考': '新JAN備考'})
-        combined_df = pd.concat([combined_df, kao_df], ignore_index=True)
-        print(f"✅ 花王: {len(kao_df)}件")
+        # ★★★ ソート済みのリストで処理（スレッドで並列に読み込み、結果はソート順のまま） ★★★
+        with ThreadPoolExecutor(max_workers=min(MAX_LOAD_WORKERS, len(sorted_kao_paths))) as executor:
+            kao_frames = list(executor.map(load_kao, sorted_kao_paths))
+        frames.extend(kao_frames)
+        print(f"✅ 花王: {sum(len(df) for df in kao_frames)}件")
 
     # プラネットデータ処理
     if planet_paths_selected:
         print("\n🔄 プラネットデータ処理中...")
         planet_diff_df = process_planet_diff(planet_paths_selected) 
         if not planet_diff_df.empty:
-            combined_df = pd.concat([combined_df, planet_diff_df], ignore_index=True)
+            frames.append(planet_diff_df)
             print(f"✅ プラネット: {len(planet_diff_df)}件")
         else:
             print("⚠️ プラネットデータが生成されませんでした")
 
+    combined_df = pd.concat(frames, ignore_index=True, copy=False) if frames else pd.DataFrame()
     if combined_df.empty:
         messagebox.showwarning("データなし", "結合できるデータがありませんでした", icon='warning')
         return
@@ -8,49 +8,152 @@ Created by HIBI KEITA
 # 1. ライブラリのインポート 
 # ----------------------------------------
 
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog, messagebox
 import os
-# 処理: 文字列の類似度計算ライブラリをインポート
-# 理由: 商品名称の曖昧突合処理を正確かつ高速に行うため。
-from fuzzywuzzy import fuzz 
+import heapq
+from functools import lru_cache
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+# 処理: 文字列の類似度計算ライブラリ（rapidfuzz）をインポート
+# 理由: 商品名称の曖昧突合処理を正確かつ高速に行うため。fuzzywuzzyと同じfuzz.ratioをC++実装のビット並列アルゴリズムで計算できる。
+from rapidfuzz import fuzz
+# 処理: CSVの高速読み込み用にpyarrowをインポート（無い環境ではpandasの読み込みにフォールバック）
+# 理由: pyarrowのCSVパーサはマルチスレッドで動作し、大きなマスタCSVの読み込みを大幅に短縮できるため。
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 処理: デバッグ出力の有無を切り替えるフラグ
+# 理由: 行ごとの診断printは大量のコンソール出力になり処理が遅くなるため、本番では無効にしておく。
+DEBUG = False
+
+# 処理: 照合結果のラベル定義（結果配列にはこのリストの位置をint8のコード値で保持する）
+# 理由: 行ごとに文字列を持たせず、最後にカテゴリ型として一括で展開するため。
+MATCH_RESULT_LABELS = ['新規 or 削除品', '高類似度候補あり (80%以上)', '低類似度 (80%未満・要手動確認)']
+MATCH_RESULT_NONE, MATCH_RESULT_HIGH, MATCH_RESULT_LOW = 0, 1, 2
+
+# 処理: 並列処理に切り替える旧品件数のしきい値
+# 理由: 件数が少ない場合はプロセス起動とデータ転送のコストが照合時間を上回るため、そのまま逐次処理する。
+PARALLEL_MIN_ROWS = 2000
+
+# 処理: 照合処理で参照する新品側のデータ（プロセスごとに _init_match_worker で設定）
+# 理由: 行ごとの照合関数をモジュールレベルに置き、ワーカープロセスからも呼び出せるようにするため。
+_MATCH_CONTEXT = None
 
 
 # ----------------------------------------
 # 2. コアロジック関数
 # ----------------------------------------
 
-def calculate_similarity(s1: str, s2: str) -> float:
-    """二つの文字列の類似度（0.0〜1.0）を計算します。"""
-    # 処理: fuzz.ratioで得た0-100のスコアを100で割って正規化
-    # 理由: 類似度スコアを標準的な0.0〜1.0の範囲に揃えるため。
-    return fuzz.ratio(s1, s2) / 100.0
+def calculate_similarity(s1: str, s2: str, score_cutoff: float = 0) -> float:
+    """二つの文字列の類似度（0.0〜1.0）を計算します。score_cutoff（0-100）未満の組み合わせは0.0を返します。"""
+    # 処理: fuzz.ratioで得た0-100のスコアを整数に丸めてから100で割って正規化
+    # 理由: 類似度スコアを標準的な0.0〜1.0の範囲に揃えるため。rapidfuzzは小数のスコアを返すので、
+    #       fuzzywuzzyと同じく整数に丸め、80%判定・候補の並び・レポートの値を従来と揃える。
+    #       score_cutoffを渡すと、それに届かない組み合わせは文字列長の差などから早期に見切られ、編集距離の計算が省略される。
+    return round(fuzz.ratio(s1, s2, score_cutoff=score_cutoff)) / 100.0
+
+
+def read_csv_pyarrow(p: Path):
+    """shift_jisのCSVをpyarrowで読み込む関数。pandasと結果が変わる不揃い行がある場合はNoneを返す"""
+    # 処理: shift_jisのバイト列を一度だけUTF-8に変換し、pyarrowのマルチスレッドCSVパーサで読み込む。不揃い行はスキップ
+    # 理由: pandasのshift_jis読み込みはシングルスレッドで遅いため。Arrow型のまま保持して後続の比較処理も高速化する。
+    #       引用符内の改行はpandasと同じく値の一部として扱う（newlines_in_values）。行が分割されて不揃い行扱いになるのを防ぐため。
+    with open(p, 'rb') as f:
+        data = f.read().decode('shift_jis').encode('utf-8')
+    skipped_rows = []
+    
+    def skip_invalid_row(row):
+        skipped_rows.append(row)
+        return 'skip'
+    
+    table = pacsv.read_csv(
+        pa.BufferReader(data),
+        parse_options=pacsv.ParseOptions(delimiter=',', newlines_in_values=True, invalid_row_handler=skip_invalid_row),
+        convert_options=pacsv.ConvertOptions(strings_can_be_null=True),
+    )
+    
+    # 処理: スキップした不揃い行を件数と内容（先頭の数件）で表示
+    # 理由: データが黙って欠落しないよう、どの行が読み込まれなかったかをユーザーが確認できるようにするため。
+    if skipped_rows:
+        print(f"⚠️ {p.name}: 列数が合わない{len(skipped_rows)}行をスキップしました")
+        for row in skipped_rows[:5]:
+            print(f"   （{row.actual_columns}列/想定{row.expected_columns}列）{row.text[:80]}")
+    
+    # 処理: 列が足りない行があればNoneを返し、pandasで読み直させる
+    # 理由: pandasは列が足りない行を欠損値で埋めて読み込む（スキップするのは列が多い行だけ）ため、結果を揃える。
+    if any(row.actual_columns < row.expected_columns for row in skipped_rows):
+        print("   列が足りない行を空欄で読み込むため、pandasで読み直します")
+        return None
+    
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
 
 
-def load_data(file_path: str, suffix: str) -> pd.DataFrame:
-    """ファイルを読み込み、suffixをカラムに付与する関数"""
+def read_master_file(p: Path) -> pd.DataFrame:
+    """拡張子に応じてマスタファイル（CSV/Excel）を読み込む関数"""
     # 処理: pathlibを使って拡張子を取得し、小文字に変換
     # 理由: 拡張子（例: .XLSX）の大文字・小文字によるファイル判別エラーを防ぎ、安定性を高めるため。
-    p = Path(file_path)
     ext = p.suffix.lower()
     
     if ext == '.csv':
-        # 処理: CSVファイルをshift_jis エンコーディングで読み込み、不揃い行をスキップ
-        # 理由: 日本語の文字化けを防ぎ、データ行の不整合があっても処理を続行できるようにするため。
-        df = pd.read_csv(file_path, encoding='shift_jis', delimiter=',', on_bad_lines='skip')
+        # 処理: pyarrowがあればpyarrowで読み込み、使えない場合（Noneが返る）はpandasで読み込む
+        # 理由: 読み込み結果はpandasと揃えつつ、大きなマスタCSVの読み込みを高速化するため。
+        df = read_csv_pyarrow(p) if PYARROW_AVAILABLE else None
+        if df is None:
+            # 処理: CSVファイルをshift_jis エンコーディングで読み込み、不揃い行をスキップ
+            # 理由: 日本語の文字化けを防ぎ、データ行の不整合があっても処理を続行できるようにするため。
+            df = pd.read_csv(p, encoding='shift_jis', delimiter=',', on_bad_lines='skip')
     
     elif ext in ['.xlsx', '.xls']:
         # 処理: Excelファイルを読み込み（自動で適切なエンコーディングが適用される）
         # 理由: Excelファイルをサポートし、ユーザーが複数のファイル形式を使用できるようにするため。
-        df = pd.read_excel(file_path)
+        df = pd.read_excel(p)
         
     else:
         # 処理: サポート外のファイル形式の場合、例外を発生させて処理を停止
         # 理由: 不正なファイル形式での処理を防ぎ、ユーザーに明確なエラーメッセージを通知するため。
         raise ValueError(f"サポート外のファイル形式です:{ext}")
     
+    return df
+
+
+def load_data(file_path: str, suffix: str) -> pd.DataFrame:
+    """ファイルを読み込み、suffixをカラムに付与する関数"""
+    # 処理: ファイルパスと更新日時をキーに、読み込み済みの結果をメモリ上から再利用（呼び出し元にはコピーを返す）
+    # 理由: エラー後の再実行などで同じファイルを何度も解析しないため。ファイルが更新されれば更新日時が変わり再読み込みされる。
+    #       コピーを返すのは、呼び出し側でのカラム追加などがキャッシュ内のDFに影響しないようにするため。
+    resolved_path = str(Path(file_path).resolve())
+    return _load_data_cached(resolved_path, os.path.getmtime(resolved_path), suffix).copy()
+
+
+@lru_cache(maxsize=8)
+def _load_data_cached(file_path: str, mtime: float, suffix: str) -> pd.DataFrame:
+    """load_data の実処理。引数の更新日時はキャッシュのキーとしてのみ使用する"""
+    p = Path(file_path)
+    
+    # 処理: 元ファイルの隣にParquetキャッシュを置き、元ファイルより新しければそちらを読み込む
+    # 理由: 毎回のshift_jisデコードやExcelのXML解析を省き、2回目以降の読み込みを大幅に短縮するため。
+    cache_path = p.with_name(p.name + '.parquet')
+    if PYARROW_AVAILABLE and cache_path.exists() and cache_path.stat().st_mtime >= p.stat().st_mtime:
+        df = pd.read_parquet(cache_path)
+    else:
+        df = read_master_file(p)
+        if PYARROW_AVAILABLE:
+            # 処理: 読み込んだ結果をzstd圧縮のParquetとして保存（失敗しても処理は続行）
+            # 理由: 保存先が読み取り専用の場合や型が混在した列がある場合でも、突合処理自体は止めないため。
+            try:
+                df.to_parquet(cache_path, compression='zstd')
+            except Exception as e:
+                print(f"⚠️ Parquetキャッシュの保存に失敗しました（処理は続行）: {e}")
+    
     # 処理: DataFrame内の文字列 'NULL' を Pandasの欠損値 pd.NA に置換
     # 理由: CSV内に文字列として存在する 'NULL' を、正しく欠損値として扱えるようにデータ品質を向上させるため。
     df = df.replace('NULL', pd.NA)
@@ -74,7 +177,8 @@ def load_data(file_path: str, suffix: str) -> pd.DataFrame:
     
     # 処理: デバッグ用：読み込み後のカラム名をコンソールに出力
     # 理由: どのカラムが実際に存在しているか確認し、エラーの原因を特定するため。
-    print(f"Load data columns ({suffix}): {df.columns.tolist()}") 
+    if DEBUG:
+        print(f"Load data columns ({suffix}): {df.columns.tolist()}")
 
     # 処理: 読み込んだDataFrameの全カラム名に接尾辞（_新または_旧）を付与
     # 理由: 後の突合処理で新旧のカラム名を明確に区別するため、コードの正確性を確保する。
@@ -82,11 +186,118 @@ def load_data(file_path: str, suffix: str) -> pd.DataFrame:
     
     # 処理: デバッグ用：suffix付きのカラム名をコンソールに出力
     # 理由: add_suffix() が正しく機能しているか確認するため。
-    print(f"After add_suffix ({suffix}): {df.columns.tolist()}")
+    if DEBUG:
+        print(f"After add_suffix ({suffix}): {df.columns.tolist()}")
     
     return df
 
 
+def _init_match_worker(context: dict):
+    """突合に使う新品側のデータ（突合コンテキスト）をプロセス内のグローバル変数に設定する関数"""
+    # 処理: 新品候補の辞書やDFをモジュール変数に保持
+    # 理由: ワーカープロセスごとに一度だけ受け取り、チャンクごとに新品データを再送（pickle）しないようにするため。
+    global _MATCH_CONTEXT
+    _MATCH_CONTEXT = context
+
+
+def find_best_matches_for_row(old_row: dict) -> tuple:
+    """旧品の1行（辞書）を新品候補と照合し、(候補リスト文字列, 最高類似度, 照合結果コード, 最高類似度の新品JAN) を返す関数"""
+    # 処理: 照合に使う新品側のデータを突合コンテキストから取り出す
+    # 理由: 別プロセスのワーカーでも、初期化時に受け取ったデータだけで処理できるようにするため。
+    key_pairs = _MATCH_CONTEXT['key_pairs']
+    new_groups = _MATCH_CONTEXT['new_groups']
+    new_candidates_all = _MATCH_CONTEXT['new_candidates_all']
+    candidate_cols = _MATCH_CONTEXT['candidate_cols']
+    empty_candidates = _MATCH_CONTEXT['empty_candidates']
+    
+    # 処理: 旧品のカナ名称を取得
+    # 理由: これを基準に新品との類似度を計算するため。
+    old_product_name_kana = old_row['商品名称（カナ）_旧']
+    
+    # 処理: デバッグ用：処理対象の旧品を表示
+    # 理由: どのレコードで処理が止まっているか確認するため。
+    if DEBUG:
+        print(f"Processing old row with JAN: {old_row.get('JANコード_旧', 'N/A')}, Name: {old_product_name_kana}")
+    
+    # 処理: 旧品のキー値を取得
+    # 理由: 新品候補のグループを特定するため。
+    old_key_values = tuple(old_row[old_col] for old_col, _ in key_pairs)
+    
+    if key_pairs and all(pd.notna(value) for value in old_key_values):
+        # 処理: キーがすべて揃っている場合は、事前に作成した辞書から候補を取り出す
+        # 理由: 全新品DFを走査せず、O(1)のハッシュ検索で絶対一致の候補を得るため。
+        new_candidates = new_groups.get(old_key_values, empty_candidates)
+    else:
+        # 処理: 欠損しているキーは絞り込みに使わず、残りのキーだけでフィルタリング
+        # 理由: nan == nan は常にFalseになるため、欠損値のキーは従来どおり条件から外すため。
+        filter_condition = pd.Series(True, index=new_candidates_all.index)
+        for (_, new_col), old_value in zip(key_pairs, old_key_values):
+            if pd.notna(old_value):
+                filter_condition &= (new_candidates_all[new_col] == old_value)
+        new_candidates = new_candidates_all.loc[filter_condition, candidate_cols].drop_duplicates().to_numpy()
+    
+    if DEBUG:
+        print(f"    new_candidates size: {len(new_candidates)}")
+    
+    # 処理: 候補がない、または旧品カナ名が空の場合の処理
+    # 理由: 照合結果を「新規/削除品」として明確に分類するため。
+    if len(new_candidates) == 0 or pd.isna(old_product_name_kana):
+        # 処理: 候補がない場合の結果を返す
+        # 理由: 旧品が新マスタに存在しない、または削除された可能性があるため。
+        return '候補なし（キー不一致 or カナ名空）', 0.0, MATCH_RESULT_NONE, None
+
+    # ---------------------
+    # 類似度計算とソート
+    # ---------------------
+    # 処理: 新品候補と旧品カナ名称の類似度を順に計算し、上位3件だけを最小ヒープ（3位が先頭）に保持
+    # 理由: 必要なのは上位3件のみのため、候補全体を保持・ソートしないため。
+    #       ヒープの要素は (類似度, -候補の位置, 商品名, JAN)。同点なら先に出た候補を上位とする（従来の並び順を維持）。
+    top_heap = []
+    for position, (new_name, new_jan) in enumerate(new_candidates):
+        if len(top_heap) < 3:
+            heapq.heappush(top_heap, (calculate_similarity(old_product_name_kana, new_name), -position, new_name, new_jan))
+            continue
+        # 処理: 現在の3位のスコア（整数%）を四捨五入で上回れない候補は、score_cutoffで計算を打ち切る
+        # 理由: 後から出た候補は同点では3位に入れないため、3位+0.5%未満のスコアは正確に求めなくても結果が変わらない。
+        third_score = top_heap[0][0]
+        score = calculate_similarity(old_product_name_kana, new_name, score_cutoff=round(third_score * 100) + 0.5)
+        if score > third_score:
+            heapq.heapreplace(top_heap, (score, -position, new_name, new_jan))
+    
+    # 処理: 上位3件を類似度の降順（同点は元の並び順）に並べる
+    # 理由: レポートの候補リストを最高類似度の候補から表示するため。
+    top_candidates = [(score, name, jan) for score, _, name, jan in sorted(top_heap, reverse=True)]
+    
+    # 処理: 最高類似度の新品候補のJANコードを取得
+    # 理由: 最適な新品レコードを特定するため（新品情報はループ後にまとめて取得する）。
+    best_match_jan = top_candidates[0][2] 
+    
+    # 処理: 上位3つの候補を「商品名 (類似度%)」の形式で一つの文字列にまとめる
+    # 理由: 複数の候補を分かりやすくレポートの1セルに表示し、ユーザーの確認を容易にするため。
+    candidate_list_str = " | ".join([
+        f"{name} ({score:.1%})" for score, name, _ in top_candidates
+    ])
+    # 処理: 最高スコアを取得
+    # 理由: 最高類似度を別途レポート出力する必要があるため。
+    best_score = top_candidates[0][0] 
+    
+    # 処理: 照合結果を80%を基準に判定
+    # 理由: 高い類似度の場合は信頼度が高いと判断し、低い場合は手動確認が必要と案内するため。
+    if best_score >= 0.8: 
+        result_code = MATCH_RESULT_HIGH
+    else:
+        result_code = MATCH_RESULT_LOW
+
+    return candidate_list_str, best_score, result_code, best_match_jan
+
+
+def _match_records(records: list) -> list:
+    """旧品レコードのチャンクをまとめて照合し、行ごとの結果タプルのリストを返す関数"""
+    # 処理: チャンク内の各旧品レコードに find_best_matches_for_row を適用
+    # 理由: プロセスプールへのタスク投入を行単位ではなくチャンク単位にし、プロセス間通信の回数を抑えるため。
+    return [find_best_matches_for_row(old_row) for old_row in records]
+
+
 def process_master_data(old_path: str, new_path: str, output_dir: str):
     """
     旧マスタと新マスタを突合し、リニューアル品を抽出するメインロジック関数
@@ -109,158 +320,130 @@ def process_master_data(old_path: str, new_path: str, output_dir: str):
         
         # 処理: デバッグ用：process_master_data 内で使用するカラムが存在しているか確認
         # 理由: エラーの原因を特定するため。
-        print(f"df_old columns: {df_old.columns.tolist()}")
-        print(f"df_new columns: {df_new.columns.tolist()}")
-        print(f"Checking for required columns:")
-        print(f"  'JANコード_旧' in df_old: {'JANコード_旧' in df_old.columns}")
-        print(f"  'JANコード_新' in df_new: {'JANコード_新' in df_new.columns}")
-        print(f"  '商品名称（カナ）_旧' in df_old: {'商品名称（カナ）_旧' in df_old.columns}")
-        print(f"  '商品名称（カナ）_新' in df_new: {'商品名称（カナ）_新' in df_new.columns}")
+        if DEBUG:
+            print(f"df_old columns: {df_old.columns.tolist()}")
+            print(f"df_new columns: {df_new.columns.tolist()}")
+            print(f"Checking for required columns:")
+            print(f"  'JANコード_旧' in df_old: {'JANコード_旧' in df_old.columns}")
+            print(f"  'JANコード_新' in df_new: {'JANコード_新' in df_new.columns}")
+            print(f"  '商品名称（カナ）_旧' in df_old: {'商品名称（カナ）_旧' in df_old.columns}")
+            print(f"  '商品名称（カナ）_新' in df_new: {'商品名称（カナ）_新' in df_new.columns}")
 
         # ----------------------------------------
-        # 1. 曖昧突合処理の核となる関数（旧品の1行を基準に処理）
+        # 1. 新品候補の事前グループ化
         # ----------------------------------------
         
-        # 処理: 旧品DFの各行（Series）を受け取り、対応する新品候補の結果（Series）を返す関数を定義
-        # 理由: df_old.apply()で各旧品レコードに対して個別に処理を実行できるようにするため。
-        def find_best_matches_for_row(old_row: pd.Series) -> pd.Series:
-            
-            # 処理: 旧品のカナ名称を取得
-            # 理由: これを基準に新品との類似度を計算するため。
-            old_product_name_kana = old_row['商品名称（カナ）_旧']
-            
-            # 処理: デバッグ用：処理対象の旧品を表示
-            # 理由: どのレコードで処理が止まっているか確認するため。
-            print(f"Processing old row with JAN: {old_row.get('JANコード_旧', 'N/A')}, Name: {old_product_name_kana}")
-            
-            # 処理: 絶対キーで新品候補を絞り込む条件を初期化
-            # 理由: 全新品DFから、現在の旧品行とキーが一致するものだけを抽出することで、
-            #       処理の対象を限定し、効率と正確性を高めるため。
-            filter_condition = pd.Series(True, index=df_new.index) 
-            
-            # 処理: キーカラムごとにフィルタ条件を追加（AND結合）
-            # 理由: 複数のキー条件をすべて満たす新品レコードだけを抽出するため。
-            for col in key_columns:
-                old_key_col = col + '_旧'
-                new_key_col = col + '_新'
-                # 処理: カラムが実際に存在しているかチェック
-                # 理由: 存在しないカラムを参照してKeyErrorが発生するのを防ぐため。
-                if old_key_col in old_row.index and new_key_col in df_new.columns:
-                    old_value = old_row[old_key_col]
-                    print(f"    Filtering by {new_key_col}: {old_value}")
-                    
-                    # 処理: 旧品のキー値が欠損値（nan）でない場合のみフィルタリング
-                    # 理由: nan == nan は常にFalseになるため、欠損値の場合はフィルタリングをスキップするため。
-                    if pd.notna(old_value):
-                        filter_condition &= (df_new[new_key_col] == old_value)
-                    else:
-                        print(f"      Skipping filter (old value is nan)")
-
-            print(f"    Filtered df_new size: {filter_condition.sum()}")
-            
-            # 処理: フィルタリングされた新品候補から、商品名とJANコードを抽出
-            # 理由: 類似度計算に必要なデータセットを用意し、重複を削除するため。
-            new_candidates = df_new[filter_condition][['商品名称（カナ）_新', 'JANコード_新']].dropna().drop_duplicates()
-            print(f"    new_candidates size: {len(new_candidates)}") 
-            
-            # 処理: 候補がない、または旧品カナ名が空の場合の処理
-            # 理由: 照合結果を「新規/削除品」として明確に分類するため。
-            if new_candidates.empty or pd.isna(old_product_name_kana):
-                # 処理: 候補がない場合の結果Seriesを返す
-                # 理由: 旧品が新マスタに存在しない、または削除された可能性があるため。
-                return pd.Series({
-                    '新品候補リスト': '候補なし（キー不一致 or カナ名空）', 
-                    '最高類似度': 0.0,
-                    '照合結果': '新規 or 削除品',
-                    '判定': '新規 or 削除品',
-                })
-
-            # ---------------------
-            # 類似度計算とソート
-            # ---------------------
-            # 処理: 全ての新品候補と旧品カナ名称の類似度を計算し、タプルリストに格納
-            # 理由: 類似度スコアと商品情報をセットで保持し、後でソートを容易にするため。
-            similarities = [
-                (calculate_similarity(old_product_name_kana, row['商品名称（カナ）_新']), row['商品名称（カナ）_新'], row['JANコード_新'])
-                for _, row in new_candidates.iterrows()
-            ]
-            # 処理: 類似度が高い順にソート（降順）
-            # 理由: 最高類似度の候補を上位に持ってくるため。
-            similarities.sort(key=lambda x: x[0], reverse=True)
-            
-            # 処理: 最高類似度の新品候補のJANコードを取得
-            # 理由: 最適な新品レコードを特定するため。
-            best_match_jan = similarities[0][2] 
-            
-            # 処理: JANコードが一致する新品レコードをdf_newから抽出 (Seriesとして取得)
-            # 理由: 最高類似度の新品の全情報を取得し、旧品行に結合するため。
-            best_new_row = df_new[df_new['JANコード_新'] == best_match_jan].iloc[0]
-
-            # 処理: 必要な新品番情報をSeriesとして整形
-            # 理由: レポートに必要なカラムを抽出し、ユーザーの要望に合わせてカラム名を変更するため。
-            new_info_cols = [
-                'JANコード_新', '商品名称（カナ）_新', 'メーカー名称_新', 
-                '標準分類名(クラス)_新', 'ブランド名称_新', '目付_新', '発売日_新' 
-            ]
-            
-            # 処理: 存在するカラムのみを抽出（存在しないカラムはスキップ）
-            # 理由: KeyErrorを防ぐため。
-            existing_new_info_cols = [col for col in new_info_cols if col in best_new_row.index]
-            new_info_for_report = best_new_row[existing_new_info_cols].rename(
-                # 処理: '標準分類名(クラス)_新' をユーザー要望の '標準分類(クラス)_新' にリネーム
-                # 理由: レポートの表記を統一し、ユーザーの期待に合わせるため。
-                {'標準分類名(クラス)_新': '標準分類(クラス)_新'}
-            )
-            
-            print(f"  new_info_for_report: {new_info_for_report.to_dict()}")
-            
-            # 処理: 上位3つの候補を「商品名 (類似度%)」の形式で一つの文字列にまとめる
-            # 理由: 複数の候補を分かりやすくレポートの1セルに表示し、ユーザーの確認を容易にするため。
-            top_candidates = similarities[:3]
-            candidate_list_str = " | ".join([
-                f"{name} ({score:.1%})" for score, name, _ in top_candidates
-            ])
-            # 処理: 最高スコアを取得
-            # 理由: 最高類似度を別途レポート出力する必要があるため。
-            best_score = similarities[0][0] 
-            
-            # 処理: 照合結果を80%を基準に判定
-            # 理由: 高い類似度の場合は信頼度が高いと判断し、低い場合は手動確認が必要と案内するため。
-            if best_score >= 0.8: 
-                result = '高類似度候補あり (80%以上)'
-            else:
-                result = '低類似度 (80%未満・要手動確認)'
-
-            # 処理: 分析結果と最高候補の情報を結合して返す
-            # 理由: 最終レポートに旧品情報と新品番情報を一元化するため。
-            result_series = pd.Series({
-                '新品候補リスト': candidate_list_str, 
-                '最高類似度': best_score,
-                '照合結果': result,
-                '判定': result,
-            })
-            # 処理: 分析結果Seriesと新品情報Seriesを結合
-            # 理由: 1つのSeriesとして返すことで、df_old.apply()で適切に結合できるようにするため。
-            return pd.concat([result_series, new_info_for_report])
+        # 処理: 新旧両方に存在するキーカラムの組（旧カラム名, 新カラム名）を一度だけ確定
+        # 理由: 存在しないカラムを参照してKeyErrorが発生するのを防ぎ、行ごとの存在チェックをなくすため。
+        key_pairs = [
+            (col + '_旧', col + '_新') for col in key_columns
+            if col + '_旧' in df_old.columns and col + '_新' in df_new.columns
+        ]
+        new_key_cols = [new_col for _, new_col in key_pairs]
+        candidate_cols = ['商品名称（カナ）_新', 'JANコード_新']
+        
+        # 処理: 新品DFから商品名・JANの欠損行と重複行を一度だけ除去
+        # 理由: 旧品1行ごとに dropna().drop_duplicates() を繰り返さないため。
+        new_candidates_all = df_new[candidate_cols + new_key_cols].dropna(subset=candidate_cols).drop_duplicates()
+        
+        # 処理: キーカラムの値の組み合わせごとに、新品候補の（商品名, JAN）を2次元配列にまとめた辞書を作成
+        # 理由: 旧品1行ごとに全新品DFへのフィルタ条件を作り直さず、キーのハッシュ検索で候補を取り出すため。
+        #       また配列で持つことで、候補ごとにSeriesを生成するiterrows()を使わずに済むため。
+        new_groups = {
+            key: group[candidate_cols].to_numpy()
+            for key, group in new_candidates_all.groupby(new_key_cols, sort=False)
+        } if new_key_cols else {}
+        empty_candidates = np.empty((0, len(candidate_cols)), dtype=object)
 
         # ----------------------------------------
         # 2. 結果の実行と結合
         # ----------------------------------------
         
-        # 処理: 旧品DFの各行に対して、find_best_matches_for_row 関数を適用し、結果を新しいDFとして生成
-        # 理由: ループ処理より効率的なPandasのベクトル化処理（apply）で、旧品リストの全レコードを一括処理するため。
-        print(f"Starting analysis on {len(df_old)} old records...")
-        analysis_result = df_old.apply(find_best_matches_for_row, axis=1)
+        # 処理: 結果を格納する配列を旧品の件数分だけ事前に確保（列ごとに独立した配列で保持）
+        # 理由: apply()で行ごとにSeriesを生成・結合するコストをなくし、最後に一度だけDataFrame化するため。
+        n = len(df_old)
+        candidate_str = np.empty(n, dtype=object)
+        best_score = np.zeros(n, dtype=np.float32)
+        result_code = np.zeros(n, dtype=np.int8)
+        best_jan = np.empty(n, dtype=object)
+
+        # 処理: 照合に必要な新品側のデータを突合コンテキストとしてまとめる
+        # 理由: 逐次処理・並列処理のどちらでも同じ照合関数を使えるようにするため。
+        match_context = {
+            'key_pairs': key_pairs,
+            'new_groups': new_groups,
+            'new_candidates_all': new_candidates_all,
+            'candidate_cols': candidate_cols,
+            'empty_candidates': empty_candidates,
+        }
+        old_records = df_old.to_dict('records')
+        workers = os.cpu_count() or 1
+
+        # 処理: 旧品DFの各行に対して find_best_matches_for_row を実行し、結果を配列の同じ位置に書き込む
+        # 理由: 旧品リストの全レコードを一括処理するため。
+        print(f"Starting analysis on {n} old records...")
+        row_results = None
+        if n >= PARALLEL_MIN_ROWS and workers > 1:
+            # 処理: 旧品レコードをCPU数のチャンクに分割し、プロセスプールで並列に照合（結果は元の順序で返る）
+            # 理由: 類似度計算はPythonレベルの処理でGILにより1コアしか使えないため、プロセスを分けて複数コアで処理する。
+            #       新品データは initializer で各ワーカーに一度だけ渡し、チャンクごとの転送コストを避ける。
+            bounds = np.linspace(0, n, workers + 1, dtype=int)
+            chunks = [old_records[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+            try:
+                with ProcessPoolExecutor(max_workers=len(chunks), initializer=_init_match_worker,
+                                         initargs=(match_context,)) as executor:
+                    row_results = [row for part in executor.map(_match_records, chunks) for row in part]
+            except (OSError, BrokenProcessPool) as e:
+                # 処理: プロセスを起動できない環境では逐次処理に切り替える
+                # 理由: 並列化に失敗しても、突合処理自体は止めずに結果を出力するため。
+                print(f"⚠️ 並列処理を開始できなかったため、逐次処理で続行します: {e}")
+        if row_results is None:
+            _init_match_worker(match_context)
+            row_results = _match_records(old_records)
+        for i, row_result in enumerate(row_results):
+            candidate_str[i], best_score[i], result_code[i], best_jan[i] = row_result
         print(f"Analysis completed successfully!")
 
+        # 処理: 最高類似度の新品の情報を、JANコードをキーにしてまとめて取得
+        # 理由: 行ごとにdf_newを検索せず、1回のreindexで全旧品分の新品情報を揃えるため。
+        new_info_cols = [
+            'JANコード_新', '商品名称（カナ）_新', 'メーカー名称_新', 
+            '標準分類名(クラス)_新', 'ブランド名称_新', '目付_新', '発売日_新' 
+        ]
+        existing_new_info_cols = [col for col in new_info_cols if col in df_new.columns]
+        new_info_by_jan = (df_new.dropna(subset=['JANコード_新'])
+                                 .drop_duplicates(subset=['JANコード_新'])
+                                 .set_index('JANコード_新', drop=False)[existing_new_info_cols])
+        new_info_for_report = new_info_by_jan.reindex(best_jan).rename(
+            # 処理: '標準分類名(クラス)_新' をユーザー要望の '標準分類(クラス)_新' にリネーム
+            # 理由: レポートの表記を統一し、ユーザーの期待に合わせるため。
+            columns={'標準分類名(クラス)_新': '標準分類(クラス)_新'}
+        )
+        new_info_for_report.index = df_old.index
+
+        # 処理: 結果配列から分析結果DFを構築（照合結果コードはラベルのカテゴリ型に展開）
+        # 理由: 旧品DFと同じインデックスで結合できる形にするため。
+        result_labels = pd.Categorical.from_codes(result_code, categories=MATCH_RESULT_LABELS)
+        analysis_result = pd.concat([
+            pd.DataFrame({
+                '新品候補リスト': candidate_str,
+                '最高類似度': best_score,
+                '照合結果': result_labels,
+                '判定': result_labels,
+            }, index=df_old.index),
+            new_info_for_report,
+        ], axis=1)
+
         # 処理: 旧品DFと分析結果DFを結合（インデックスが合うためそのまま結合）
         # 理由: 元の旧品リストに、新しい分析結果カラムと最高類似度の新品情報を追加するため。
-        print(f"analysis_result shape: {analysis_result.shape}")
-        print(f"analysis_result columns: {analysis_result.columns.tolist()}")
-        print(f"df_old shape: {df_old.shape}")
+        if DEBUG:
+            print(f"analysis_result shape: {analysis_result.shape}")
+            print(f"analysis_result columns: {analysis_result.columns.tolist()}")
+            print(f"df_old shape: {df_old.shape}")
         
         final_df = pd.concat([df_old, analysis_result], axis=1)
-        print(f"final_df columns: {final_df.columns.tolist()}")
+        if DEBUG:
+            print(f"final_df columns: {final_df.columns.tolist()}")
 
 
         # ----------------------------------------
@@ -428,6 +611,9 @@ class MasterMatcherApp:
 # 4. メイン処理（アプリ起動）
 # ----------------------------------------
 if __name__ == "__main__":
+    # 処理: exe化した場合でもプロセスプールのワーカーが正しく起動するよう設定
+    # 理由: Windows（spawn方式）でワーカーがGUIを再起動せず、照合処理だけを実行するようにするため。
+    multiprocessing.freeze_support()
     # 処理: Tkinterのメインウィンドウを初期化し、アプリケーションを実行
     # 理由: Pythonスクリプトとして直接実行されたときにGUIを起動するための標準的な記述方法。
     root = tk.Tk()
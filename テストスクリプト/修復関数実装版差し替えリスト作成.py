@@ -6,50 +6,142 @@ author : HibiKeita
 
 from pathlib import Path
 import os
+import hashlib
+import importlib.util
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
 import pandas as pd
-import tkinter as tk
-from tkinter import filedialog, messagebox
 
-# Excelの自動修復に使うライブラリやで！
-try:
-    import win32com.client as win32
-    import pythoncom
-    WIN32COM_AVAILABLE = True
-except ImportError:
-    WIN32COM_AVAILABLE = False
+# Excelの自動修復に使うライブラリやで！（起動を軽くするため、入っとるかだけ見て、importは修復するときまでせん）
+WIN32COM_AVAILABLE = importlib.util.find_spec('win32com') is not None and importlib.util.find_spec('pythoncom') is not None
+if not WIN32COM_AVAILABLE:
     print("⚠️ win32comライブラリが見つかりません。Excelの自動修復機能は無効になります。")
     print("もし修復が必要なエラーが出たら、'pip install pywin32' でインストールしてや！")
 
+# Excelの高速読み込みに使うライブラリ（Rust製のcalamine）やで！
+try:
+    import python_calamine
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+    print("⚠️ python-calamineが見つかりません。Excelはopenpyxlで読み込みます（少し遅くなります）。")
+
+# 文字列列をArrow形式で持つためのライブラリやで！（無ければ通常の文字列型で処理）
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Excel出力を速くするライブラリ（xlsxwriter）やで！無ければopenpyxlで出力する
+try:
+    import xlsxwriter
+    EXCEL_WRITE_ENGINE = 'xlsxwriter'
+except ImportError:
+    EXCEL_WRITE_ENGINE = 'openpyxl'
+
 # --- 0. 設定と初期化 ---
 
 # 環境変数を使ってデフォルト保存先を指定します
 ROOT_DIR = Path(os.path.expanduser("~")) / "Box/D0RM_RM_130_リテールテクノロジー研究部/新/103_棚割/002_Allo/001_社内/002_マニュアル関連/差し替えリスト/差し替えリスト出力先（バックアップ版）"
 
+# openpyxlは読み取り専用モードで開く（セルの値だけを順に読み、ブック全体をメモリに展開しない）
+OPENPYXL_READ_ONLY_KWARGS = {'read_only': True, 'data_only': True, 'keep_links': False}
+
+# JANコード・商品名の整形に使う文字列型（Arrow形式ならC実装の演算でまとめて処理できる）
+STRING_DTYPE = 'string[pyarrow]' if PYARROW_AVAILABLE else 'string'
+
+# 花王の商品と判定するメーカー列のパターン（コードが4901301始まり、または名前に花王株式会社を含む）を1つの正規表現で
+KAO_MAKER_PATTERN = r'^4901301|花王株式会社'
+
+# Excelを並列に読み込むときの最大スレッド数
+MAX_LOAD_WORKERS = 8
+
+# ExcelをCSVに変換したキャッシュの保存先（一時フォルダ）
+CSV_CACHE_DIR = Path(tempfile.gettempdir()) / "差し替えリスト_Excelキャッシュ"
+
+# この日数以上使われていないCSVキャッシュは削除する
+CSV_CACHE_MAX_AGE_DAYS = 30
+
 # --- Excel自動修復関数 ---
+# COM（Excel）は作ったスレッドでしか使えないので、修復は専用の1スレッドにまとめて順番にやるで！
+# Excel本体もそのスレッドで1回だけ起動して、修復のたびに使い回す（起動に1〜2秒かかるため）
+_COM_EXECUTOR = None
+_COM_EXECUTOR_LOCK = threading.Lock()
+_EXCEL = None
+
+def _get_com_executor():
+    """修復用のCOM専用スレッド（初回だけ作る。スレッド開始時にCoInitializeしとく）"""
+    global _COM_EXECUTOR
+    with _COM_EXECUTOR_LOCK:
+        if _COM_EXECUTOR is None:
+            import pythoncom
+            _COM_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='excel_com',
+                                               initializer=pythoncom.CoInitialize)
+        return _COM_EXECUTOR
+
+def _get_excel():
+    """COM専用スレッドの中で、使い回すExcelを返す（初回だけ起動）"""
+    global _EXCEL
+    if _EXCEL is None:
+        import win32com.client as win32
+        _EXCEL = win32.Dispatch('Excel.Application')
+        _EXCEL.Visible = False
+        _EXCEL.DisplayAlerts = False
+    return _EXCEL
+
+def _quit_excel():
+    """COM専用スレッドの中で、起動しとったExcelを終了する"""
+    global _EXCEL
+    if _EXCEL is not None:
+        try:
+            _EXCEL.Quit()
+        finally:
+            _EXCEL = None
+
+def shutdown_excel():
+    """
+    使い回しとったExcelを終了して、COM専用スレッドも片付ける
+    （atexitの時点ではスレッドがもう止まっとるので、処理の最後に明示的に呼ぶ）
+    """
+    global _COM_EXECUTOR
+    with _COM_EXECUTOR_LOCK:
+        if _COM_EXECUTOR is None:
+            return
+        executor, _COM_EXECUTOR = _COM_EXECUTOR, None
+    try:
+        executor.submit(_quit_excel).result()
+    except Exception as e:
+        print(f"⚠️ Excelの終了に失敗しました: {e}")
+    finally:
+        executor.shutdown()
+
 def repair_and_resave_excel(file_path):
     """
     WindowsのExcelアプリケーションを起動し、破損したExcelファイルを
     開いて修復し、上書き保存する
+    実際の処理はCOM専用スレッドで行うので、どのスレッドから呼んでもOK（他のファイルの読み込みは止まらない）
     """
     if not WIN32COM_AVAILABLE:
         return False
-        
-    p_file = Path(file_path)
-    print(f"🛠️ Excelを起動して、ファイルを自動修復しています: {p_file.name}")
-    
-    excel = None
-    
     try:
-        pythoncom.CoInitialize()
-    except:
-        pass 
-        
+        executor = _get_com_executor()
+    except ImportError as e:
+        print(f"❌ win32comの読み込みに失敗したため、修復できません: {e}")
+        return False
+    return executor.submit(_repair_in_com_thread, Path(file_path)).result()
+
+def _repair_in_com_thread(p_file):
+    """COM専用スレッドの中で、使い回しのExcelでファイルを開いて上書き保存する"""
+    print(f"🛠️ Excelで、ファイルを自動修復しています: {p_file.name}")
+    
     try:
-        excel = win32.Dispatch('Excel.Application')
-        excel.Visible = False
-        excel.DisplayAlerts = False
-        
-        workbook = excel.Workbooks.Open(str(p_file.resolve()), UpdateLinks=False, ReadOnly=False)
+        workbook = _get_excel().Workbooks.Open(str(p_file.resolve()), UpdateLinks=False, ReadOnly=False)
         workbook.Save()
         workbook.Close(SaveChanges=False)
         
@@ -58,19 +150,17 @@ def repair_and_resave_excel(file_path):
         
     except Exception as e:
         print(f"❌ 自動修復に失敗しました: {p_file.name} - エラー: {e}")
-        return False
-        
-    finally:
-        if excel is not None:
-            excel.Quit()
-        
+        # Excelが固まっとるかもしれんので、次の修復では起動し直す
         try:
-            pythoncom.CoUninitialize()
-        except:
-            pass 
+            _quit_excel()
+        except Exception:
+            pass
+        return False
 
 # --- GUIでファイルを選択する関数 ---
 def select_files(title, filetypes, multiple=False):
+    import tkinter as tk
+    from tkinter import filedialog
     root = tk.Tk()
     root.withdraw()
 
@@ -93,33 +183,120 @@ def select_files(title, filetypes, multiple=False):
 
 # --- 出力フォルダを選択する関数 ---
 def select_output_folder(title="結果を保存するフォルダを選択してください"):
+    import tkinter as tk
+    from tkinter import filedialog
     root = tk.Tk()
     root.withdraw()
     folder_path = filedialog.askdirectory(title=title)
     root.destroy()
     return Path(folder_path) if folder_path else None
 
+# --- Excel読み込み（読み取り専用モード → 失敗時は通常モード） ---
+def read_excel_openpyxl(path, **read_excel_kwargs):
+    """
+    openpyxlの読み取り専用モードで読み込む
+    シート寸法の情報が壊れているなどで読み取り専用モードで読めない場合は、通常モードで読み直す
+    """
+    try:
+        return pd.read_excel(path, engine='openpyxl', engine_kwargs=OPENPYXL_READ_ONLY_KWARGS, **read_excel_kwargs)
+    except Exception as e:
+        print(f"⚠️ 読み取り専用モードで読み込めませんでした。通常モードで再試行します: {e}")
+        return pd.read_excel(path, engine='openpyxl', engine_kwargs={'read_only': False}, **read_excel_kwargs)
+
+# --- Excel読み込み（calamine → 失敗時はopenpyxl） ---
+def read_excel_fast(path, **read_excel_kwargs):
+    """
+    calamineエンジンで読み込む（セルの値だけを高速に読む）
+    calamineが無い、またはcalamineで読めないファイルはopenpyxlで読み込む
+    """
+    if CALAMINE_AVAILABLE:
+        try:
+            return pd.read_excel(path, engine='calamine', **read_excel_kwargs)
+        except Exception as e:
+            print(f"⚠️ calamineで読み込めませんでした。openpyxlで再試行します: {e}")
+    return read_excel_openpyxl(path, **read_excel_kwargs)
+
+# --- Excel読み込み（CSVキャッシュ経由） ---
+def prune_csv_cache(keep_path, path_key):
+    """
+    CSVキャッシュの古いものを削除する
+    同じ元ファイルの古い版（更新前の日時のもの）と、CSV_CACHE_MAX_AGE_DAYS以上使われていないものが対象
+    （別スレッドが読み込み中などで消せなければ、次回に回す）
+    """
+    expire = time.time() - CSV_CACHE_MAX_AGE_DAYS * 24 * 60 * 60
+    for cache_file in CSV_CACHE_DIR.glob('*.csv'):
+        if cache_file == keep_path:
+            continue
+        try:
+            if f"_{path_key}_" in cache_file.name or cache_file.stat().st_mtime < expire:
+                cache_file.unlink()
+        except OSError:
+            pass
+
+def read_excel_cached(path, dtype=None, **read_excel_kwargs):
+    """
+    Excelの先頭シートを値だけのCSV（UTF-8）に一度だけ変換して保存し、pd.read_csvで読み込む
+    キャッシュ名には元ファイルのパスと更新日時を含めるので、元ファイルが更新されたら作り直す
+    CSVにはセルの型が残らないため、呼び出し元がdtypeを指定していない列は文字列で読み戻す
+    （読み戻しで型を推測させると、文字列の'0012'が12になるなど元のセルと変わってしまうため）
+    """
+    p_file = Path(path).resolve()
+    path_key = hashlib.md5(str(p_file).encode('utf-8')).hexdigest()
+    csv_path = CSV_CACHE_DIR / f"{p_file.stem}_{path_key}_{p_file.stat().st_mtime_ns}.csv"
+
+    if csv_path.exists():
+        # 使った日時を更新しておく（使われ続けているキャッシュが期限切れで消されないように）
+        try:
+            os.utime(csv_path)
+        except OSError:
+            pass
+    else:
+        # 全セルを文字列のまま書き出す（JANの桁落ちを防ぐ）
+        raw_df = read_excel_fast(p_file, header=None, dtype=str)
+        try:
+            CSV_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            # 同じファイルを複数スレッドで同時に変換しても衝突しないよう、一時ファイル名にスレッドIDを付ける
+            tmp_path = csv_path.with_suffix(f'.{threading.get_ident()}.tmp')
+            raw_df.to_csv(tmp_path, index=False, header=False, encoding='utf-8')
+            tmp_path.replace(csv_path)
+        except OSError as e:
+            print(f"⚠️ CSVキャッシュの保存に失敗しました。Excelから直接読み込みます: {e}")
+            return read_excel_fast(p_file, dtype=dtype, **read_excel_kwargs)
+        prune_csv_cache(csv_path, path_key)
+
+    # 指定の無い列は文字列で読む（defaultdictの既定値）。空のセルだけを欠損値にする
+    # （'NA'などの文字列はExcel読み込みの時点で欠損値になっており、CSVでは空になっている）
+    return pd.read_csv(csv_path, encoding='utf-8', dtype=defaultdict(lambda: str, dtype or {}),
+                       keep_default_na=False, na_values=[''], **read_excel_kwargs)
+
 # --- 改善版：修復失敗時も通常読み込みにフォールバック ---
-def load_with_repair(path, **read_excel_kwargs):
+class ExcelLoadError(Exception):
+    """読み込み・修復に失敗したときの例外やで！エラーダイアログのタイトルも持っとく"""
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+
+def load_with_repair(path, show_dialog=True, **read_excel_kwargs):
     """
     Excelファイルを読み込む
     流れ：
     1. 通常通り読み込みを試みる
     2. 失敗したら修復を試みて再度読み込み
-    3. 修復失敗または修復不可なら、ユーザーにエラー表示
+    3. 修復失敗または修復不可なら、ユーザーにエラー表示してExcelLoadErrorを投げる
+    show_dialog=False のときは、エラー表示を呼び出し元に任せる（スレッドからの並列読み込み用）
     """
     p_file = Path(path)
     
     # ステップ1: 通常通り読み込みを試みる
     try:
         print(f"📖 ファイルを読み込み中: {p_file.name}")
-        df = pd.read_excel(p_file, engine='openpyxl', **read_excel_kwargs)
+        df = read_excel_cached(p_file, **read_excel_kwargs)
         print(f"✅ 読み込み成功（修復不要）")
         return df
     except Exception as e:
         print(f"⚠️ 通常読み込み失敗: {e}")
         
-        # ステップ2: 修復を試みる
+        # ステップ2: 修復を試みる（修復自体はCOM専用スレッドで行われる）
         if WIN32COM_AVAILABLE:
             print(f"🔧 修復を試みています...")
             repair_success = repair_and_resave_excel(p_file)
@@ -128,37 +305,63 @@ def load_with_repair(path, **read_excel_kwargs):
                 # 修復成功したら再度読み込み
                 try:
                     print(f"📖 修復後のファイルを読み込み中...")
-                    df = pd.read_excel(p_file, engine='openpyxl', **read_excel_kwargs)
+                    df = read_excel_openpyxl(p_file, **read_excel_kwargs)
                     print(f"✅ 修復・読み込み成功")
                     return df
                 except Exception as retry_e:
                     print(f"❌ 修復後も読み込み失敗: {retry_e}")
-                    messagebox.showerror("読み込みエラー", 
+                    error = ExcelLoadError("読み込みエラー", 
                         f"ファイル '{p_file.name}' の修復と読み込みに失敗しました。\n\n"
                         f"エラー詳細: {str(retry_e)}\n\n"
                         f"ファイルが破損している可能性があります。")
-                    raise
+                    cause = retry_e
             else:
                 print(f"❌ 修復処理に失敗しました")
-                messagebox.showerror("修復失敗", 
+                error = ExcelLoadError("修復失敗", 
                     f"ファイル '{p_file.name}' の修復に失敗しました。\n\n"
                     f"ファイルが破損している可能性があります。")
-                raise
+                cause = e
         else:
             # win32comが無い場合
             print(f"⚠️ win32comが利用不可のため、修復できません")
-            messagebox.showerror("修復不可", 
+            error = ExcelLoadError("修復不可", 
                 f"ファイル '{p_file.name}' の読み込みに失敗しました。\n\n"
                 f"修復ツール（win32com）が利用不可です。\n"
                 f"管理者に連絡してください。")
+            cause = e
+
+    if show_dialog:
+        from tkinter import messagebox
+        messagebox.showerror(error.title, str(error))
+    raise error from cause
+
+# --- 並列読み込み（修復が要るファイルはCOM専用スレッドで直しつつ、他のファイルは読み続ける） ---
+def load_in_parallel(loaders):
+    """
+    読み込み関数（show_dialogを受け取るもの）のリストをスレッドで並列に実行し、同じ順番で結果を返す
+    修復はCOM専用スレッドで行われるので、修復待ちの間も他のファイルの読み込みは進む
+    エラーダイアログ（tkinter）はメインスレッドで出す
+    """
+    with ThreadPoolExecutor(max_workers=min(MAX_LOAD_WORKERS, len(loaders))) as executor:
+        futures = [executor.submit(loader, show_dialog=False) for loader in loaders]
+
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except ExcelLoadError as e:
+            from tkinter import messagebox
+            messagebox.showerror(e.title, str(e))
             raise
+    return results
 
 # --- 1. 花王データ読み込み関数 ---
-def load_kao(path):
+def load_kao(path, show_dialog=True):
     """改善版：修復失敗時もエラーで明示"""
     try:
         df = load_with_repair(
             path,
+            show_dialog=show_dialog,
             usecols=[6, 14, 41, 43],
             skiprows=5,
             header=None,
@@ -167,7 +370,7 @@ def load_kao(path):
         
         df.columns = ['新商品名', '新JAN', '旧JAN', '旧商品名']
         df = df.dropna(subset=['旧JAN', '新JAN'])[['旧JAN', '旧商品名', '新JAN', '新商品名']]
-        df['備考'] = path.name
+        df['備考'] = pd.Series(path.name, index=df.index, dtype='category')  # 全行同じファイル名なのでカテゴリ型
         return df
     except Exception as e:
         print(f"❌ 花王ファイルの処理に失敗: {path.name}")
@@ -177,32 +380,37 @@ def load_kao(path):
 def clean_planet(df, mode):
     df.columns = df.columns.str.replace('ＪＡＮ', 'JAN')
     
+    # 使う列だけ先に取り出してから欠損除外・列名変更する（他の列までコピーせんで済む）
     if mode == 'discontinue':
-        required_cols = ['JANコード', '新JANコード', '廃番予定品', '新商品名'] 
-        df = df.dropna(subset=required_cols)
-        
-        return df.rename(columns={
+        required_cols = ['JANコード', '廃番予定品', '新JANコード', '新商品名']
+        return df[required_cols].dropna().rename(columns={
             'JANコード': '旧JAN',
             '新JANコード': '新JAN',
             '廃番予定品': '旧商品名',
             '新商品名': '新商品名'
-        })[['旧JAN', '旧商品名', '新JAN', '新商品名']]
+        })
     else: # mode == 'new'
-        df = df.dropna(subset=['JANコード', '旧JANコード']) 
-
-        return df.rename(columns={'旧JANコード': '旧JAN', 'JANコード': '新JAN', '商品名全角': '新商品名'})[
-            ['旧JAN', '新JAN', '新商品名']
-        ]
+        return df[['旧JANコード', 'JANコード', '商品名全角']].dropna(subset=['JANコード', '旧JANコード']).rename(
+            columns={'旧JANコード': '旧JAN', 'JANコード': '新JAN', '商品名全角': '新商品名'}
+        )
 
 # --- 3. 純粋新規品抽出 ---
 def extract_unmatched(new_df, old_df):
-    add = new_df[~new_df['新JAN'].isin(old_df['旧JAN'])].copy()
-    add['旧商品名'] = ''
-    return add[['旧JAN', '旧商品名', '新JAN', '新商品名']]
+    # 重複を除いた旧JANと左結合し、一致しなかった行だけを残す
+    old_jans = old_df[['旧JAN']].drop_duplicates().rename(columns={'旧JAN': '新JAN'})
+    flagged = new_df.merge(old_jans, on='新JAN', how='left', indicator='旧JAN一致', validate='m:1')
+    # 旧商品名は空文字（assignで追加するので、抽出結果を.copy()しなくてよい）
+    return (flagged.loc[flagged['旧JAN一致'] == 'left_only', new_df.columns]
+                   .assign(旧商品名='')[['旧JAN', '旧商品名', '新JAN', '新商品名']])
 
 # --- 4. クレンジング前除外処理 ---
 def exclude_kao(df, is_kao_col):
-    return df[~df[is_kao_col].astype(str).str.startswith('4901301') & ~df[is_kao_col].astype(str).str.contains('花王株式会社')]
+    # メーカー列をカテゴリ型にして、花王かどうかの判定はメーカー（カテゴリ）ごとに1回だけ行う
+    # 欠損値（コード -1）は末尾に追加したFalse（除外しない）を参照する
+    makers = df[is_kao_col].astype('category')
+    maker_names = makers.cat.categories.astype(str)
+    is_kao_maker = np.append(maker_names.str.contains(KAO_MAKER_PATTERN, regex=True), False)
+    return df[~is_kao_maker[makers.cat.codes.to_numpy()]]
 
 # --- 5. プラネット差し替えリスト生成 ---
 def process_planet_diff(planet_paths_dict):
@@ -213,19 +421,15 @@ def process_planet_diff(planet_paths_dict):
         try:
             print(f"\n【{season}の処理】")
             
-            # 新規品の読み込み
-            new_df = load_with_repair(
-                paths['new'],
-                dtype={'ＪＡＮコード': str, '旧ＪＡＮコード': str}
-            )
-            new_df['備考'] = paths['new'].name
-            
-            # 廃番品の読み込み
-            disc_df = load_with_repair(
-                paths['disc'],
-                dtype={'JANコード': str, '新JANコード': str, '廃番予定品': str, '新商品名': str}
-            )
-            disc_df['備考'] = paths['disc'].name
+            # 新規品・廃番品の読み込み（2ファイルを並列に）
+            new_df, disc_df = load_in_parallel([
+                partial(load_with_repair, paths['new'],
+                        dtype={'ＪＡＮコード': str, '旧ＪＡＮコード': str}),
+                partial(load_with_repair, paths['disc'],
+                        dtype={'JANコード': str, '新JANコード': str, '廃番予定品': str, '新商品名': str}),
+            ])
+            new_df['備考'] = pd.Series(paths['new'].name, index=new_df.index, dtype='category')
+            disc_df['備考'] = pd.Series(paths['disc'].name, index=disc_df.index, dtype='category')
             
             # 花王関連のデータを除外
             new_df = exclude_kao(new_df, 'メーカーコード')
@@ -235,26 +439,23 @@ def process_planet_diff(planet_paths_dict):
             new_clean = clean_planet(new_df, 'new')
             disc_clean = clean_planet(disc_df, 'discontinue')
             
-            disc_not_in_new_by_new_jan = disc_clean[
-                ~disc_clean['新JAN'].isin(new_clean['新JAN'])
-            ].copy()
-            
-            final_disc_additions = disc_not_in_new_by_new_jan[
-                ~disc_not_in_new_by_new_jan['旧JAN'].isin(new_clean['旧JAN'])
-            ].copy()
+            # 新規品リストの新JAN・旧JANのどちらにも一致しない廃番品だけを残す
+            # （JANは重複を除いたIndexとして一度だけ作り、2つの条件は1つのブール式で判定）
+            new_jan_index = pd.Index(new_clean['新JAN'].unique())
+            old_jan_index = pd.Index(new_clean['旧JAN'].unique())
+            final_disc_additions = disc_clean[
+                ~disc_clean['新JAN'].isin(new_jan_index) & ~disc_clean['旧JAN'].isin(old_jan_index)
+            ]
             
             pure_new_items = extract_unmatched(new_clean, disc_clean)
             
             combined_planet_diff = pd.concat([pure_new_items, final_disc_additions], ignore_index=True)
             
-            combined_planet_diff_with_notes = pd.merge(
-                combined_planet_diff, 
-                new_df[['JANコード', '備考']], 
-                left_on='新JAN', 
-                right_on='JANコード', 
-                how='left'
-            )
-            combined_planet_diff_with_notes = combined_planet_diff_with_notes.drop(columns='JANコード').rename(columns={'備考': '新JAN備考'})
+            # JANコード → 備考 の対応表（JANの重複は除く）をmapで引く（結合で行が増えない）
+            new_jan_notes = new_df.drop_duplicates('JANコード').set_index('JANコード')['備考']
+            combined_planet_diff_with_notes = combined_planet_diff.assign(新JAN備考=combined_planet_diff['新JAN'].map(new_jan_notes))
+            # JAN列は期ごとに型を揃えとく（最後の結合で型がバラバラやとobjectに変換し直しになるため）
+            combined_planet_diff_with_notes = combined_planet_diff_with_notes.astype({'新JAN': STRING_DTYPE, '旧JAN': STRING_DTYPE})
             
             result.append(combined_planet_diff_with_notes)
             print(f"✅ {season}の処理完了（{len(combined_planet_diff_with_notes)}件）")
@@ -263,25 +464,29 @@ def process_planet_diff(planet_paths_dict):
             print(f"❌ {season}の処理に失敗しました。スキップします。")
             continue
     
-    return pd.concat(result, ignore_index=True) if result else pd.DataFrame()
+    return pd.concat(result, ignore_index=True, copy=False) if result else pd.DataFrame()
 
 # --- 6. クリーンアップ処理 ---
 def finalize(df):
     df = df.rename(columns={'旧JAN': '旧JANコード', '新JAN': '新JANコード'})
     
     for col in ['旧JANコード', '新JANコード']:
-        df[col] = (df[col].astype(str)
-                             .str.replace(r'\D+', '', regex=True)
-                             .replace('', pd.NA)
-                             .apply(lambda x: str(x).zfill(13)[:13] if pd.notna(x) else pd.NA)) 
+        # 文字列型のままベクトル演算で処理（NFKCで全角数字を半角に → 半角数字以外を除去 → 空は欠損 → 13桁に0埋めして切り出し）
+        jan = df[col].astype(STRING_DTYPE).str.normalize('NFKC').str.replace('[^0-9]+', '', regex=True)
+        df[col] = jan.mask(jan == '').str.zfill(13).str.slice(0, 13)
+
+    df['旧商品名'] = df['旧商品名'].astype(STRING_DTYPE).replace('', '該当文字列なし')
+    df['新商品名'] = df['新商品名'].astype(STRING_DTYPE).replace('', '該当文字列なし')
 
-    df['旧商品名'] = df['旧商品名'].replace('', '該当文字列なし')
-    df['新商品名'] = df['新商品名'].replace('', '該当文字列なし')
+    # ファイル名の繰り返しなのでカテゴリ型にしておく（ファイルごとのカテゴリ型は結合で文字列に戻るため、ここでまとめて変換）
+    df['新JAN備考'] = df['新JAN備考'].astype('category')
 
-    return df[df['旧JANコード'] != df['新JANコード']].drop_duplicates()
+    # 欠損を含む比較は「異なる」として残す
+    return df[(df['旧JANコード'] != df['新JANコード']).fillna(True)].drop_duplicates()
 
 # --- 7. メイン処理 ---
 def main():
+    from tkinter import messagebox
     # --- ファイル選択UI ---
     messagebox.showinfo("ファイル選択", "花王の上期新規品・廃止品リスト（複数選択可）を選んでください。", icon='info')
     kao_upper_period_file_paths = select_files("花王の上期新規品・廃止品リストを選択", [("Excelファイル", "*.xlsm *.xlsx")], multiple=True)
@@ -347,16 +552,21 @@ def main():
         messagebox.showinfo("キャンセル", f"デフォルト保存先を使用します。{output_dir}")
 
     # --- データ処理開始 ---
-    combined_df = pd.DataFrame()
+    frames = []  # 花王・プラネットの結果を集めて、最後に一度だけ結合する
 
     if all_kao_file_paths:
-        kao_df = pd.concat([load_kao(p) for p in all_kao_file_paths], ignore_index=True)
+        # 上期・下期で同じブックを選んどっても、開いて読むのは1回だけ（結果を使い回す）
+        unique_kao_paths = list(dict.fromkeys(all_kao_file_paths))
+        kao_by_path = dict(zip(unique_kao_paths, load_in_parallel([partial(load_kao, p) for p in unique_kao_paths])))
+        kao_df = pd.concat([kao_by_path[p] for p in all_kao_file_paths], ignore_index=True)
         kao_df = kao_df.rename(columns={'備考': '新JAN備考'})
-        combined_df = pd.concat([combined_df, kao_df], ignore_index=True)
+        frames.append(kao_df)
 
     if planet_paths_selected:
         planet_diff_df = process_planet_diff(planet_paths_selected) 
-        combined_df = pd.concat([combined_df, planet_diff_df], ignore_index=True)
+        frames.append(planet_diff_df)
+
+    combined_df = pd.concat(frames, ignore_index=True, copy=False) if frames else pd.DataFrame()
 
     if combined_df.empty:
         messagebox.showwarning("データなし", "結合できるデータが一つもありませんでした。", icon='warning')
@@ -364,12 +574,16 @@ def main():
 
     final_df = finalize(combined_df)
     
-    final_df.to_csv(output_dir / "花王・プラネット差し替えリスト完成版.csv", index=False, encoding='cp932', errors='replace')
-    final_df.to_excel(output_dir / "花王・プラネット差し替えリスト完成版.xlsx", index=False, engine='openpyxl')
+    final_df.to_csv(output_dir / "花王・プラネット差し替えリスト完成版.csv", index=False, encoding='cp932', errors='replace',
+                    chunksize=50_000)
+    final_df.to_excel(output_dir / "花王・プラネット差し替えリスト完成版.xlsx", index=False, engine=EXCEL_WRITE_ENGINE)
     
     messagebox.showinfo("完了", f"🎉 差し替えリスト作成完了！CSVとExcelを出力しました。\n出力先: {output_dir}", icon='info')
     print("花王とプラネットのデータ統合と、差し替えリストの生成が完了しました。")
 
 # スクリプトが直接実行された場合にのみ、main関数を呼び出します。
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        shutdown_excel()
\ No newline at end of file
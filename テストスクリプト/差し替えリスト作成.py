@@ -5,21 +5,65 @@ author : HibiKeita
 """
 
 from pathlib import Path
+import numpy as np
 import pandas as pd
-import tkinter as tk
-from tkinter import filedialog, messagebox
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Excelの高速読み込みに使うcalamine（Rust製のExcelパーサ）をインポートします。
+# 理由：セルの値だけを読むこのスクリプトでは、openpyxlよりも大幅に速く、メモリ使用量も少ないためです。インストールされていない環境ではopenpyxlで読み込みます。
+try:
+    import python_calamine
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+# 文字列列をArrow形式で扱うためにpyarrowをインポートします。
+# 理由：Arrow形式の文字列型では、置換や0埋めなどの文字列処理がC実装の演算で列ごとにまとめて実行され、1要素ずつPythonオブジェクトを扱うより高速なためです。インストールされていない環境では通常の文字列型で処理します。
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Excel出力に使うxlsxwriterをインポートします。
+# 理由：値だけを書き出す用途では、openpyxlよりも大幅に高速にExcelファイルを作成できるためです。インストールされていない環境ではopenpyxlで出力します。
+try:
+    import xlsxwriter
+    EXCEL_WRITE_ENGINE = 'xlsxwriter'
+except ImportError:
+    EXCEL_WRITE_ENGINE = 'openpyxl'
 
 # --- 0. 設定と初期化 ---
 
 # スクリプトのルートディレクトリを指定します。
 # このパスは、ファイル選択がキャンセルされた場合などの、出力ファイルのデフォルト基準ディレクトリとして使用します。
-ROOT_DIR = Path(os.path.expanduser("~")/"Box/D0RM_RM_130_リテールテクノロジー研究部/新/103_棚割/002_Allo/001_社内/002_マニュアル関連/差し替えリスト/差し替えリスト出力先（バックアップ版）") 
+ROOT_DIR = Path(os.path.expanduser("~")) / "Box/D0RM_RM_130_リテールテクノロジー研究部/新/103_棚割/002_Allo/001_社内/002_マニュアル関連/差し替えリスト/差し替えリスト出力先（バックアップ版）"
+
+# openpyxlを読み取り専用モードで開くための設定です。
+# 理由：ブック全体のオブジェクト（書式や空白領域を含む）をメモリに展開せず、セルの値だけを行単位で読み込むことで、読み込み時間とメモリ使用量を抑えるためです。
+OPENPYXL_READ_ONLY_KWARGS = {'read_only': True, 'data_only': True, 'keep_links': False}
+
+# JANコード・商品名の整形に使う文字列型です（pyarrowがあればArrow形式）。
+STRING_DTYPE = 'string[pyarrow]' if PYARROW_AVAILABLE else 'string'
+
+# 花王の商品と判定するメーカー列のパターンです（メーカーコードが「4901301」で始まる、またはメーカー名に「花王株式会社」を含む）。
+# 理由：2つの条件を1つの正規表現にまとめ、文字列の走査を1回で済ませるためです。
+KAO_MAKER_PATTERN = r'^4901301|花王株式会社'
+
+# Excelファイルを並列に読み込む際の最大スレッド数です。
+# 理由：ファイル数が多くてもディスクやメモリへの負荷が過大にならないよう、同時に読み込む数に上限を設けるためです。
+MAX_LOAD_WORKERS = 8
 
 # --- GUIでファイルを選択する関数 ---
 # ファイル選択ダイアログを表示し、ユーザーにファイルパスを選択させる機能を提供します。
 # 理由：ファイルパスをコードに直接記述せず、実行時に柔軟にユーザーが指定できるようにするためです。
 def select_files(title, filetypes, multiple=False):
+    # Tkinterはダイアログを表示するこの時点でインポートします。
+    # 理由：GUIを使わずにモジュールを読み込む場合（関数の単体利用など）に、Tkinterの読み込み時間とメモリを省くためです。
+    import tkinter as tk
+    from tkinter import filedialog
+
     # Tkinterのルートウィンドウを作成します。これはダイアログの親となりますが、表示はしません。
     # 理由：ファイル選択のみが目的であり、余分なウィンドウ表示を避けるためです。
     root = tk.Tk()
@@ -50,6 +94,9 @@ def select_files(title, filetypes, multiple=False):
 # 結果のCSV/Excelファイルを保存するフォルダをユーザーに選択させます。
 # 理由：出力先を固定せず、ユーザーが毎回自由に保存先を指定できるようにするためです。
 def select_output_folder(title="結果を保存するフォルダを選択してください"):
+    import tkinter as tk
+    from tkinter import filedialog
+
     # Tkinterのルートウィンドウを作成し、非表示にします。
     root = tk.Tk()
     root.withdraw()
@@ -58,17 +105,53 @@ def select_output_folder(title="結果を保存するフォルダを選択して
     # フォルダが選択された場合はPathオブジェクトを返し、キャンセルされた場合はNoneを返します。
     return Path(folder_path) if folder_path else None
 
+# --- Excel読み込み関数 ---
+# openpyxlの読み取り専用モードでExcelファイルを読み込みます。
+# 理由：読み取り専用モードは一部のファイル（シート寸法の情報が壊れているものなど）で失敗することがあるため、その場合のみ通常モードで読み直し、処理を止めないためです。
+def read_excel_openpyxl(path, **read_excel_kwargs):
+    try:
+        return pd.read_excel(path, engine='openpyxl', engine_kwargs=OPENPYXL_READ_ONLY_KWARGS, **read_excel_kwargs)
+    except Exception as e:
+        print(f"⚠️ 読み取り専用モードで読み込めませんでした。通常モードで再試行します: {e}")
+        return pd.read_excel(path, engine='openpyxl', engine_kwargs={'read_only': False}, **read_excel_kwargs)
+
+# Excelブックを開き、pd.ExcelFileとして返します（calamineエンジンを優先）。
+# 理由：zipの展開や共有文字列表の解析をブックごとに一度だけ行い、開いたブックからの読み込みで使い回すためです。
+#       calamineが利用できない環境や、calamineで開けないファイルの場合はopenpyxlで開きます。
+def open_excel_book(path):
+    if CALAMINE_AVAILABLE:
+        try:
+            return pd.ExcelFile(path, engine='calamine')
+        except Exception as e:
+            print(f"⚠️ calamineで開けませんでした。openpyxlで再試行します: {e}")
+    return pd.ExcelFile(path, engine='openpyxl', engine_kwargs=OPENPYXL_READ_ONLY_KWARGS)
+
+# 開いたExcelブックからシートを読み込みます。
+# 理由：開いたエンジンで読み込めなかった場合でも、openpyxlでファイルから読み直して処理を続行するためです。
+def parse_excel_book(book, **read_excel_kwargs):
+    try:
+        return book.parse(**read_excel_kwargs)
+    except Exception as e:
+        print(f"⚠️ {book.engine}で読み込めませんでした。openpyxlで再試行します: {e}")
+        return read_excel_openpyxl(book.io, **read_excel_kwargs)
+
+# Excelファイルを開いて読み込み、すぐに閉じます。
+# 理由：複数のファイルをスレッドで並列に読み込む際、ファイルごとにブックの開閉を完結させるためです。
+def read_excel_file(path, **read_excel_kwargs):
+    with open_excel_book(path) as book:
+        return parse_excel_book(book, **read_excel_kwargs)
+
 # --- 1. 花王データ読み込み関数 ---
 # 花王のExcelファイルを読み込み、必要な列を抽出・整形し、備考列を追加します。
 # 理由：花王データ特有の形式（ヘッダ位置、列番号）に対応し、後続の処理に必要な形式に統一するためです。
-def load_kao(path):
+def load_kao(book): # open_excel_bookで開いたブック（pd.ExcelFile）を受け取ります。
     # Excelファイルを読み込みます。
     # usecolsで必要な列（7, 15, 42, 44列目：0始まり）を選択し、skiprowsで最初の5行をスキップします。
     # 理由：花王ファイルの形式に基づき、データ本体のみを効率的に読み込むためです。
     # dtype={14: str, 41: str}により、JANコード列を文字列として読み込みます。
     # 理由：JANコードの先頭や末尾の0が数値型として扱われて消えるのを防ぐためです。
-    df = pd.read_excel(path, usecols=[6, 14, 41, 43], skiprows=5, header=None, engine='openpyxl',
-                        dtype={14: str, 41: str}) 
+    df = parse_excel_book(book, usecols=[6, 14, 41, 43], skiprows=5, header=None,
+                          dtype={14: str, 41: str}) 
     
     # 読み込んだ列に分かりやすい名前を付けます。
     # 理由：コードの可読性を高め、後の処理でどの列が何を示すか一目でわかるようにするためです。
@@ -80,9 +163,16 @@ def load_kao(path):
 
     # 元のファイル名を「備考」列として追加します。
     # 理由：データの出所を記録し、後のデータ追跡や重複チェック時に役立てるためです。
-    df['備考'] = path.name # path.nameでファイル名のみを取得します。
+    # 全行が同じファイル名になるため、カテゴリ型（文字列は1つだけ保持し、各行は整数コードで参照）にしてメモリを節約します。
+    df['備考'] = pd.Series(Path(book.io).name, index=df.index, dtype='category') # ブックのファイルパスからファイル名のみを取得します。
     return df
 
+# 花王のExcelファイルを開いてload_kaoで読み込み、ブックを閉じます。
+# 理由：スレッドプールから1ファイル単位で呼び出せるようにするためです。
+def load_kao_file(path):
+    with open_excel_book(path) as book:
+        return load_kao(book)
+
 # --- 2. プラネットクレンジング関数 ---
 # プラネットの新規品・廃番品データを、花王データとの結合に向けて統一的に整形します。
 # 理由：プラネットの新規品と廃番品でファイルの列構造が異なるため、この関数で共通の「旧JAN」「新JAN」構造に変換するためです。
@@ -93,10 +183,11 @@ def clean_planet(df, mode):
     
     if mode == 'discontinue':
         # 廃番品（discontinue）のデータを処理する場合です。
-        # 必要な列を特定し、欠損値がある行を除外します。
+        # 必要な列だけを出力の並び順で先に取り出し、欠損値がある行を除外します。
         # 理由：差し替え情報（旧→新）として必須の要素が揃っているデータのみを抽出するためです。
-        required_cols = ['JANコード', '新JANコード', '廃番予定品', '新商品名'] 
-        df = df.dropna(subset=required_cols)
+        #       また、先に4列に絞ることで、欠損除外や列名変更で使わない列までコピーせずに済むためです。
+        required_cols = ['JANコード', '廃番予定品', '新JANコード', '新商品名']
+        df = df[required_cols].dropna()
         
         # 列名を統一的な名前に変更します。
         # 理由：花王データや新規品データとの結合時に、列名の一貫性を保つためです。
@@ -105,31 +196,31 @@ def clean_planet(df, mode):
             '新JANコード': '新JAN',     # 廃番品（新）のJANコードを新JANとする
             '廃番予定品': '旧商品名',   # 廃番予定品の商品名を旧商品名とする
             '新商品名': '新商品名'    # 新しい商品名を新商品名とする
-        })[['旧JAN', '旧商品名', '新JAN', '新商品名']] # 必要な列のみを抽出します。
+        })
     else: # mode == 'new'
         # 新規品（new）のデータを処理する場合です。
-        # 差し替え情報として機能する、「JANコード（新）」と「旧JANコード」が揃っている行のみを抽出します。
+        # 必要な3列だけを先に取り出し、「JANコード（新）」と「旧JANコード」が揃っている行のみを抽出します。
         # 理由：新規品リストから、差し替え情報（旧JANコードが存在するもの）を特定するためです。
-        df = df.dropna(subset=['JANコード', '旧JANコード']) 
+        #       また、先に列を絞ることで、使わない列までコピーせずに済むためです。
+        df = df[['旧JANコード', 'JANコード', '商品名全角']].dropna(subset=['JANコード', '旧JANコード'])
 
         # 列名を統一的な名前に変更します。
         # 理由：新旧JANと新商品名の対応を明確にするためです。
-        return df.rename(columns={'旧JANコード': '旧JAN', 'JANコード': '新JAN', '商品名全角': '新商品名'})[
-            ['旧JAN', '新JAN', '新商品名']
-        ]
+        return df.rename(columns={'旧JANコード': '旧JAN', 'JANコード': '新JAN', '商品名全角': '新商品名'})
 
 # --- 3. 純粋新規品抽出 ---
 # 新規品リスト（new_df）の中から、廃番品リスト（old_df）に旧商品として含まれていない「純粋な新規品」を抽出します。
 # 理由：差し替えではない、真に市場に追加された新規品を特定し、重複なくリストに追加するためです。
 def extract_unmatched(new_df, old_df):
     # 新規品リストの「新JAN」が、廃番品リストの「旧JAN」に含まれていない行を抽出します。
-    # 理由：効率的なブールインデックス（~.isin()）を用いることで、「差し替え対象ではない新規品」を高速にフィルタリングするためです。
-    add = new_df[~new_df['新JAN'].isin(old_df['旧JAN'])].copy()
-    
-    # 純粋新規品には対応する旧商品名がないため、列を空文字で初期化します。
-    # 理由：後のデータ結合時に列の整合性を保ち、データ型の不一致を防ぐためです。
-    add['旧商品名'] = ''
-    return add[['旧JAN', '旧商品名', '新JAN', '新商品名']]
+    # 理由：重複を除いた旧JANとの左結合（indicator付き）で一致の有無を一度のハッシュ結合で判定し、「差し替え対象ではない新規品」をフィルタリングするためです。
+    #       validate='m:1'により、結合で行が増えていないことも確認します。
+    old_jans = old_df[['旧JAN']].drop_duplicates().rename(columns={'旧JAN': '新JAN'})
+    flagged = new_df.merge(old_jans, on='新JAN', how='left', indicator='旧JAN一致', validate='m:1')
+    # 純粋新規品には対応する旧商品名がないため、列を空文字で初期化します（assignで新しいデータフレームとして追加します）。
+    # 理由：後のデータ結合時に列の整合性を保ち、データ型の不一致を防ぐためです。抽出結果を.copy()で複製してから列を追加する必要がなくなります。
+    return (flagged.loc[flagged['旧JAN一致'] == 'left_only', new_df.columns]
+                   .assign(旧商品名='')[['旧JAN', '旧商品名', '新JAN', '新商品名']])
 
 # --- 4. クレンジング前除外処理 ---
 # プラネットのデータから、花王関連の商品を除外します。
@@ -137,7 +228,13 @@ def extract_unmatched(new_df, old_df):
 def exclude_kao(df, is_kao_col):
     # 指定された列（メーカーコードまたはメーカー名）が「4901301」（花王のメーカーコード）で始まるもの、または「花王株式会社」を含む行を**除外**します。
     # 理由：メーカーコードやメーカー名による確実な花王データのフィルタリングを行うためです。astype(str)は、列が数値型の場合でも文字列操作を可能にするためです。
-    return df[~df[is_kao_col].astype(str).str.startswith('4901301') & ~df[is_kao_col].astype(str).str.contains('花王株式会社')]
+    # 処理方法：列をカテゴリ型に変換し、判定は重複のないメーカー（カテゴリ）ごとに1回だけ行い、その結果を各行のコードで引きます。
+    #           欠損値（コード -1）は末尾に追加したFalse（除外しない）を参照します。
+    # 理由：同じメーカーが何度も出現するため、全行に文字列処理を行うより判定回数を大幅に減らせるためです。
+    makers = df[is_kao_col].astype('category')
+    maker_names = makers.cat.categories.astype(str)
+    is_kao_maker = np.append(maker_names.str.contains(KAO_MAKER_PATTERN, regex=True), False)
+    return df[~is_kao_maker[makers.cat.codes.to_numpy()]]
 
 # --- 5. プラネット差し替えリスト生成 ---
 # 期間ごとのプラネット新規品・廃番品データを処理し、差し替えリストを生成します。
@@ -149,14 +246,20 @@ def process_planet_diff(planet_paths_dict): # 選択されたファイルパス
     for season, paths in planet_paths_dict.items():
         # 新規品と廃番品のExcelファイルを読み込みます。
         # 理由：JANコードの精度を保つため、関連列を文字列型（str）で読み込みます。
-        new_df = pd.read_excel(paths['new'], engine='openpyxl',
-                                 dtype={'ＪＡＮコード': str, '旧ＪＡＮコード': str})
-        disc_df = pd.read_excel(paths['disc'], engine='openpyxl',
-                                 dtype={'JANコード': str, '新JANコード': str, '廃番予定品': str, '新商品名': str})
+        # 2つのファイルはスレッドで並列に読み込みます。
+        # 理由：Excelの解析処理の多くはGILを解放するC/Rust実装で行われるため、2ファイルの読み込み時間を重ねて待ち時間を短縮できるためです。
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            new_future = executor.submit(read_excel_file, paths['new'],
+                                         dtype={'ＪＡＮコード': str, '旧ＪＡＮコード': str})
+            disc_future = executor.submit(read_excel_file, paths['disc'],
+                                          dtype={'JANコード': str, '新JANコード': str, '廃番予定品': str, '新商品名': str})
+            new_df = new_future.result()
+            disc_df = disc_future.result()
 
         # 備考列としてファイル名を追加します。
-        new_df['備考'] = paths['new'].name
-        disc_df['備考'] = paths['disc'].name
+        # 全行が同じファイル名になるため、カテゴリ型で保持します。
+        new_df['備考'] = pd.Series(paths['new'].name, index=new_df.index, dtype='category')
+        disc_df['備考'] = pd.Series(paths['disc'].name, index=disc_df.index, dtype='category')
 
         # 花王関連のデータを除外します。
         # 理由：データ重複の排除と、花王以外の差し替え情報に焦点を絞るためです。
@@ -170,15 +273,16 @@ def process_planet_diff(planet_paths_dict): # 選択されたファイルパス
         # --- 新規品リスト優先の重複排除ロジック ---
         # 1. 新規品リストに新JANが記載されている廃番品データは、新規品リスト側を正として排除します。
         # 理由：新規品リストを優先的な差し替え情報ソースとみなし、廃番品リストとの重複を排除するためです。
-        disc_not_in_new_by_new_jan = disc_clean[
-            ~disc_clean['新JAN'].isin(new_clean['新JAN'])
-        ].copy()
-
-        # 2. 上記で残った廃番品データのうち、旧JANが新規品リストの旧JANと重複する場合も排除します。
+        # 2. 旧JANが新規品リストの旧JANと重複する廃番品データも排除します。
         # 理由：新規品リストで既に「旧商品」として扱われているものを、廃番品リストから再度取り込まないようにするためです。
-        final_disc_additions = disc_not_in_new_by_new_jan[
-            ~disc_not_in_new_by_new_jan['旧JAN'].isin(new_clean['旧JAN'])
-        ].copy()
+        # 処理方法：新規品リストの新JAN・旧JANを、重複を除いたIndex（ハッシュ表）として先に一度だけ作成し、
+        #           2つの条件を1つのブール式にまとめて、廃番品データを1回のフィルタで抽出します。
+        # 理由：結合で中間のデータフレームを作らず、ハッシュ表の再構築もせずに判定するためです。
+        new_jan_index = pd.Index(new_clean['新JAN'].unique())
+        old_jan_index = pd.Index(new_clean['旧JAN'].unique())
+        final_disc_additions = disc_clean[
+            ~disc_clean['新JAN'].isin(new_jan_index) & ~disc_clean['旧JAN'].isin(old_jan_index)
+        ]
 
         # 純粋な新規品を抽出します。
         # 理由：差し替えではない、真の新規品を特定するためです。
@@ -190,14 +294,20 @@ def process_planet_diff(planet_paths_dict): # 選択されたファイルパス
         
         # 結合したデータに、元の新規品リストの備考列を結合し直します。
         # 理由：clean_planet処理で備考列が失われたため、どの新規品がどのファイルから来たかを記録し直すためです。
-        # 結合キーには、元のnew_dfの'JANコード'とcombined_planet_diffの'新JAN'を使用します。
-        combined_planet_diff_with_notes = pd.merge(combined_planet_diff, new_df[['JANコード', '備考']], 
-                                                   left_on='新JAN', right_on='JANコード', how='left')
-        combined_planet_diff_with_notes = combined_planet_diff_with_notes.drop(columns='JANコード').rename(columns={'備考': '新JAN備考'})
+        # 元のnew_dfから「JANコード → 備考」の対応表（JANコードの重複を除いたSeries）を作成し、mapで新JANに対応付けます。
+        # 理由：new_dfに同じJANコードが複数行あっても結合で行が増えず、左側の全列を複製する結合より一度のハッシュ検索で軽く処理できるためです。
+        new_jan_notes = new_df.drop_duplicates('JANコード').set_index('JANコード')['備考']
+        combined_planet_diff_with_notes = combined_planet_diff.assign(新JAN備考=combined_planet_diff['新JAN'].map(new_jan_notes))
+
+        # 新JAN・旧JAN列を期間ごとに同じ文字列型へ揃えてから結果に追加します。
+        # 理由：全期間の結合時に列の型が一致していれば、objectへの変換や再統合を挟まずにそのまま連結できるためです。
+        combined_planet_diff_with_notes = combined_planet_diff_with_notes.astype({'新JAN': STRING_DTYPE, '旧JAN': STRING_DTYPE})
         
         result.append(combined_planet_diff_with_notes)
         
-    return pd.concat(result, ignore_index=True)
+    # 全期間の結果を、各データフレームを防御的にコピーせずに連結します。
+    # 理由：連結元の各期間のデータは以降使わないため、コピーを省いてメモリと時間を節約するためです。
+    return pd.concat(result, ignore_index=True, copy=False)
 
 # --- 6. クリーンアップ処理 ---
 # 最終的なデータフレームの整形、JANコードのクリーンアップ、重複排除などを行います。
@@ -208,25 +318,36 @@ def finalize(df):
     
     # JANコード列をクリーンアップします。
     # 理由：JANコードは13桁の数値として統一的に扱われるべきですが、元のファイルでは文字列や数値、非数字文字が混入することがあるため、データ品質を保証するためです。
+    # 理由（処理方法）：applyで1行ずつPython関数を呼ぶと件数に比例して遅くなるため、pandasの文字列メソッドで列全体を一括処理します。
     for col in ['旧JANコード', '新JANコード']:
-        df[col] = (df[col].astype(str)                                   # 全て文字列に変換。
-                            .str.replace(r'\D+', '', regex=True)         # 正規表現で数字以外の文字を全て除去。
-                            .replace('', pd.NA)                          # 数字除去の結果空文字になったものを欠損値に変換。
-                            # 欠損値でなければ13桁に0埋め（zfill(13)）し、先頭から13文字を切り出し（[:13]）て確実に13桁にします。
-                            .apply(lambda x: str(x).zfill(13)[:13] if pd.notna(x) else pd.NA)) 
+        jan = (df[col].astype(STRING_DTYPE)                    # 文字列型に変換（欠損値は欠損値のまま保持）。
+                      .str.normalize('NFKC')                     # 全角数字を半角数字に揃える（次の除去で全角数字まで消さないため）。
+                      .str.replace('[^0-9]+', '', regex=True))   # 正規表現で半角数字以外の文字を全て除去。
+        df[col] = (jan.mask(jan == '')                         # 数字除去の結果空文字になったものを欠損値に変換。
+                      # 13桁に0埋め（zfill(13)）し、先頭から13文字を切り出し（slice(0, 13)）て確実に13桁にします。欠損値はそのまま残ります。
+                      .str.zfill(13).str.slice(0, 13))
 
     # 商品名の空文字を「該当文字列なし」に置換します。
     # 理由：空白のままよりも、「情報がない」ことを明示することで、ユーザーの誤解を防ぎ可読性を向上させるためです。
-    df['旧商品名'] = df['旧商品名'].replace('', '該当文字列なし')
-    df['新商品名'] = df['新商品名'].replace('', '該当文字列なし')
+    df['旧商品名'] = df['旧商品名'].astype(STRING_DTYPE).replace('', '該当文字列なし')
+    df['新商品名'] = df['新商品名'].astype(STRING_DTYPE).replace('', '該当文字列なし')
+
+    # 備考列（ファイル名の繰り返し）をカテゴリ型に変換します。
+    # 理由：ファイルごとのカテゴリ型は結合時に通常の文字列型へ戻るため、最終データで改めてカテゴリ型にし、重複排除と出力時のメモリを抑えるためです。
+    df['新JAN備考'] = df['新JAN備考'].astype('category')
 
     # 旧JANコードと新JANコードが同じ行は除外します。
     # 理由：差し替えリストの目的である「何が何に変わったか」という情報を満たさない、自己差し替えの行は不要なデータであるためです。
-    return df[df['旧JANコード'] != df['新JANコード']].drop_duplicates() # 重複行を削除します。
+    # 欠損値を含む比較結果は「異なる」（True）として扱い、行を残します。
+    return df[(df['旧JANコード'] != df['新JANコード']).fillna(True)].drop_duplicates() # 重複行を削除します。
 
 # --- 7. メイン処理 ---
 # スクリプトの主要な処理の流れを管理し、全体を統括します。
 def main():
+    # メッセージボックスは、GUIを使うmain関数の中でインポートします。
+    # 理由：select_filesと同様に、モジュールの読み込みだけではTkinterを読み込まないようにするためです。
+    from tkinter import messagebox
+
     # --- ファイル選択UI ---
     # 花王の上期ファイルパスを選択
     messagebox.showinfo("ファイル選択", "花王の上期新規品・廃止品リスト（複数選択可）を選んでください。", icon='info')
@@ -295,21 +416,33 @@ def main():
         return
 
     # --- データ処理開始 ---
-    combined_df = pd.DataFrame() # 空のデータフレームを初期化します。
+    # 花王・プラネットの結果はリストに集め、最後に一度だけ結合します。
+    # 理由：途中経過のデータフレームに都度結合すると、そのたびに全データの複製が発生するためです。
+    frames = []
 
     if all_kao_file_paths:
         # 花王の全てのファイルを読み込み、結合します。
         # 理由：複数の花王データを一括で処理し、後のプラネットデータとの統合に備えるためです。
-        kao_df = pd.concat([load_kao(p) for p in all_kao_file_paths], ignore_index=True)
+        # 各ファイルはスレッドプールで並列に読み込みます（結果は選択した順に並びます）。
+        # 理由：ファイル数が多い場合に、1ファイルずつ順番に読み込むよりも全体の待ち時間を短縮するためです。
+        # 上期・下期で同じブックが選ばれている場合は、そのブックを開いて読み込むのは1回だけにし、結果を使い回します。
+        # 理由：同じブックのzip展開・共有文字列の解析・型推定を繰り返さないためです。
+        unique_kao_paths = list(dict.fromkeys(all_kao_file_paths))
+        with ThreadPoolExecutor(max_workers=min(MAX_LOAD_WORKERS, len(unique_kao_paths))) as executor:
+            kao_by_path = dict(zip(unique_kao_paths, executor.map(load_kao_file, unique_kao_paths)))
+        kao_df = pd.concat([kao_by_path[p] for p in all_kao_file_paths], ignore_index=True)
         # 備考列名を統一します。
         kao_df = kao_df.rename(columns={'備考': '新JAN備考'})
-        combined_df = pd.concat([combined_df, kao_df], ignore_index=True) # 結合します。
+        frames.append(kao_df)
 
     if planet_paths_selected:
         # プラネットの差し替えリストを生成します。
         # 理由：選択されたファイル情報に基づき、複雑な重複排除ロジックを含むプラネットデータの処理を実行するためです。
         planet_diff_df = process_planet_diff(planet_paths_selected) 
-        combined_df = pd.concat([combined_df, planet_diff_df], ignore_index=True) # 結合します。
+        frames.append(planet_diff_df)
+
+    # 集めた結果を一度だけ結合します（copy=Falseで不要な防御的コピーを避けます）。
+    combined_df = pd.concat(frames, ignore_index=True, copy=False) if frames else pd.DataFrame()
 
     if combined_df.empty:
         messagebox.showwarning("データなし", "結合できるデータが一つもありませんでした。", icon='warning')
@@ -321,11 +454,13 @@ def main():
     
     # 完成した差し替えリストをCSVファイルとして出力します。
     # encoding='cp932'とerrors='replace'は、日本語環境での文字化けを防ぎ、特殊文字があってもエラーにならずに出力するための設定です。
-    final_df.to_csv(output_dir / "花王・プラネット差し替えリスト完成版.csv", index=False, encoding='cp932', errors='replace')
+    # chunksizeを指定し、一定行数ずつ文字列に変換して書き出します（全行分の文字列を一度にメモリ上に作らないためです）。
+    final_df.to_csv(output_dir / "花王・プラネット差し替えリスト完成版.csv", index=False, encoding='cp932', errors='replace',
+                    chunksize=50_000)
 
     # Excelファイルとしても出力します。
     # 理由：CSVだけでなくExcel形式でも提供することで、ユーザーの利用環境に応じた柔軟性を持たせるためです。
-    final_df.to_excel(output_dir / "花王・プラネット差し替えリスト完成版.xlsx", index=False, engine='openpyxl')
+    final_df.to_excel(output_dir / "花王・プラネット差し替えリスト完成版.xlsx", index=False, engine=EXCEL_WRITE_ENGINE)
     
     messagebox.showinfo("完了", f"🎉 差し替えリスト作成完了！CSVとExcelを出力しました。\n出力先: {output_dir}", icon='info')
     print("花王とプラネットのデータ統合と、差し替えリストの生成が完了しました。")
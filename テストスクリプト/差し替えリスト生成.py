@@ -7,8 +7,16 @@ Created by hibi keita
 from pathlib import Path
 import pandas as pd
 
+# 文字列列をArrow形式で扱うライブラリ。無ければ通常の文字列型で処理
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 # --- 0. 設定 ---
 ROOT_DIR = Path("C:/Users/337475/Box/LTS様/■アルゴリズム関連/依頼事項")
+STRING_DTYPE = 'string[pyarrow]' if PYARROW_AVAILABLE else 'string'
 Kao_PATHS = [
     ROOT_DIR / "花王新規品廃止品リスト/2025年春/2025年春新製品廃止品対比表_バーコードなし（1225).xlsm",
     ROOT_DIR / "花王新規品廃止品リスト/2024年秋/2024年秋新製品・廃止品対比表_バーコードなし（0705）.xlsm"
@@ -74,9 +82,10 @@ def process_planet_diff():
 def finalize(df):
     df = df.rename(columns={'旧JAN': '旧JANコード', '新JAN': '新JANコード'})
     for col in ['旧JANコード', '新JANコード']:
-        df[col] = (df[col].astype(str)
-                         .str.replace(r'\D+', '', regex=True)
-                         .replace('', pd.NA)
+        df[col] = (df[col].astype(STRING_DTYPE)
+                         .str.normalize('NFKC')
+                         .str.replace('[^0-9]+', '', regex=True)
+                         .replace('', None)
                          .astype('Int64'))
     df['旧商品名'] = df['旧商品名'].replace('', '該当文字列なし')
     df['新商品名'] = df['新商品名'].replace('', '該当文字列なし')
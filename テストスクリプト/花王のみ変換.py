@@ -7,11 +7,22 @@ author :HibiKeita
 from pathlib import Path
 import pandas as pd
 
+# 文字列列をArrow形式で扱うためにpyarrowをインポートしています。
+# なぜかというと、Arrow形式の文字列型なら置換や整数への変換がC++実装で列ごとにまとめて行われ、1要素ずつPythonの文字列を扱うより速いからです。インストールされていない環境では通常の文字列型で処理します。
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 # --- 0. 設定 ---
 # スクリプトのルートディレクトリを指定します。
 # なぜここにまとめるかというと、全てのファイルの場所の基準になるからです。フォルダ構成が変わってもここだけ直せば済むように、一元管理しています。
 ROOT_DIR = Path("C:/Users/337475/Box/LTS様/■アルゴリズム関連/依頼事項")
 
+# JANコードの整形に使う文字列型です（pyarrowがあればArrow形式）。
+STRING_DTYPE = 'string[pyarrow]' if PYARROW_AVAILABLE else 'string'
+
 # 花王の新規品・廃止品リストのファイルパスをリストでまとめています。
 # なぜリストにするかというと、複数のファイルをまとめて同じ処理（読み込み・結合）を効率的に行いたいからです。
 Kao_PATHS = [
@@ -153,9 +164,10 @@ def finalize(df):
     # 文字列変換 -> 数字以外を除去 -> 空文字を欠損値に -> nullableな整数型に変換、という一連の処理を行っています。
     # なぜこの手間をかけるかというと、JANコードは数字ですが、入力過程やExcel読み込みでハイフンやスペースが混入することがあるため、統一された数値データとして扱えるようにするためです。
     for col in ['旧JANコード', '新JANコード']:
-        df[col] = (df[col].astype(str)                                  # まずは文字列に変換します。これは、`str.replace`を使うためです。
-                           .str.replace(r'\D+', '', regex=True)         # 正規表現`\D+`を使って数字以外の文字を全て空文字に置き換えています。なぜ正規表現を使うかというと、様々な非数字文字を一括で効率的に除去できるからです。
-                           .replace('', pd.NA)                           # 数字以外を除去した結果、空になった文字列（''）をPandasの欠損値`pd.NA`に変換します。なぜかというと、空文字ではなく欠損値として扱うことで後の数値処理がスムーズになるためです。
+        df[col] = (df[col].astype(STRING_DTYPE)                         # まずは文字列型に変換します。これは、`str.replace`を使うためです。欠損値は文字列'nan'にならず欠損値のまま残ります。
+                           .str.normalize('NFKC')                        # 全角数字を半角数字に揃えます。なぜかというと、次の`[^0-9]+`は半角数字しか残さないため、全角で入力されたJANコードが消えてしまうのを防ぐためです。
+                           .str.replace('[^0-9]+', '', regex=True)       # 正規表現`[^0-9]+`を使って半角数字以外の文字を全て空文字に置き換えています。なぜ正規表現を使うかというと、様々な非数字文字を一括で効率的に除去できるからです。
+                           .replace('', None)                            # 数字以外を除去した結果、空になった文字列（''）を欠損値に変換します。なぜかというと、空文字のままでは整数に変換できないためです。
                            .astype('Int64'))                             # 最後に、欠損値を含めることができる整数型`Int64`に変換しています。なぜ`Int64`かというと、Python標準の`int`型は欠損値を扱えませんが、Pandasの`Int64`は`pd.NA`を扱えるため、データ型を統一しつつ欠損値に対応するためです。
 
     # 商品名の空文字を「該当文字列なし」に置換しています。
@@ -21,6 +21,16 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from datetime import datetime
 
+# 文字列列をArrow形式で扱うライブラリ。無ければ通常の文字列型で処理
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# JANコードの比較に使う文字列型
+STRING_DTYPE = 'string[pyarrow]' if PYARROW_AVAILABLE else 'string'
+
 
 # ========================================================================
 # ファイル読み込み関数
@@ -206,24 +216,23 @@ def remove_duplicates_advanced(existing_df: pd.DataFrame,
     # ========== ステップ2: マッチング結果から花王・プラネット重複を削除 ==========
     if not matching_df.empty and existing_kao_planet_jans:
         before_count = len(matching_df)
-        matching_df = matching_df[~matching_df['新JANコード'].isin(existing_kao_planet_jans)].copy()
+        matching_df = matching_df[~matching_df['新JANコード'].isin(existing_kao_planet_jans)]
         removed_count = before_count - len(matching_df)
         if removed_count > 0:
             print(f"  ✂️ マッチング→累積内花王・プラネット重複削除: {removed_count}件")
     
     # ========== ステップ3: 今週の花王・プラネットとマッチングの重複削除 ==========
     if not kao_planet_df.empty and not matching_df.empty:
-        # 旧JAN・新JANの両方で突合
-        kao_planet_old_jans = set(kao_planet_df['旧JANコード'].dropna())
-        kao_planet_new_jans = set(kao_planet_df['新JANコード'].dropna())
+        # 旧JAN・新JANの両方で突合（Pythonのsetを作らず、ハッシュ済みIndexで1回だけ絞り込む）
+        kao_planet_old_jans = pd.Index(kao_planet_df['旧JANコード'].dropna().unique())
+        kao_planet_new_jans = pd.Index(kao_planet_df['新JANコード'].dropna().unique())
         
         before_count = len(matching_df)
         
-        # 新JANで重複しているものを削除
-        matching_df = matching_df[~matching_df['新JANコード'].isin(kao_planet_new_jans)].copy()
-        
-        # 旧JANで重複しているものを削除
-        matching_df = matching_df[~matching_df['旧JANコード'].isin(kao_planet_old_jans)].copy()
+        # 新JAN・旧JANのどちらかで重複しているものを削除
+        duplicated_mask = (matching_df['新JANコード'].isin(kao_planet_new_jans) |
+                           matching_df['旧JANコード'].isin(kao_planet_old_jans))
+        matching_df = matching_df[~duplicated_mask]
         
         removed_count = before_count - len(matching_df)
         if removed_count > 0:
@@ -249,7 +258,11 @@ def remove_duplicates_advanced(existing_df: pd.DataFrame,
     
     # ========== ステップ6: 旧JAN=新JANのものを削除 ==========
     before_same_jan = len(all_data)
-    all_data = all_data[all_data['旧JANコード'] != all_data['新JANコード']].copy()
+    # 文字列型にそろえて比較（Arrow形式なら要素ごとのPython比較ではなくArrowの比較カーネルで処理される）
+    for col in ['旧JANコード', '新JANコード']:
+        all_data[col] = all_data[col].astype(STRING_DTYPE)
+    # 欠損同士はこれまで通り「異なる」扱いで残す
+    all_data = all_data[(all_data['旧JANコード'] != all_data['新JANコード']).fillna(True)]
     after_same_jan = len(all_data)
     
     removed_same_jan = before_same_jan - after_same_jan
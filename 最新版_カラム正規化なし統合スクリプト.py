@@ -11,11 +11,40 @@ Author: HIBI KEITA
 Version: 5.1
 """
 
+import codecs
+import os
+import shutil
 import pandas as pd
 from pathlib import Path
 import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog
+from tkinter import filedialog, messagebox
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from itertools import accumulate
+
+# Excelの高速読み込み用（Rust製のcalamine）。無ければopenpyxlで読み込む
+try:
+    import python_calamine
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+    print("⚠️ python-calamineが見つかりません。Excelはopenpyxlで読み込みます（少し遅くなります）。")
+
+# 文字列列をArrow形式で扱うライブラリ。無ければ通常の文字列型で処理
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Excel出力用（xlsxwriter）。無ければopenpyxlで出力
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
 
 
 # ========================================================================
@@ -34,13 +63,37 @@ OUTPUT_COLUMNS_EXCEL = REQUIRED_COLUMNS + METADATA_COLUMNS
 # CSV出力用（システム読み込み用）
 OUTPUT_COLUMNS_CSV = REQUIRED_COLUMNS
 
+# CSV/TSVの文字コード判定に使う先頭部分のバイト数
+ENCODING_PEEK_BYTES = 64 * 1024
+
+# openpyxlの読み取り専用モード（ブック全体をメモリに展開せず、セルの値だけを行単位で読む）
+OPENPYXL_READ_ONLY_KWARGS = {'read_only': True, 'data_only': True, 'keep_links': False}
+
+# 読み込み・JANコードの整形に使う文字列型
+# （Arrow形式ならPythonの文字列オブジェクトを作らずに持て、正規表現もC++実装のRE2で一括処理できる）
+STRING_DTYPE = 'string[pyarrow]' if PYARROW_AVAILABLE else 'string'
+
 
 # ========================================================================
 # ファイル読み込み
 # ========================================================================
 
+def read_excel_openpyxl(file_path: str, **read_excel_kwargs) -> pd.DataFrame:
+    """openpyxlの読み取り専用モードで読み込み（読めない場合は通常モードで再試行）"""
+    try:
+        return pd.read_excel(file_path, engine='openpyxl', engine_kwargs=OPENPYXL_READ_ONLY_KWARGS, **read_excel_kwargs)
+    except Exception as e:
+        print(f"⚠️ 読み取り専用モードで読み込めないため、通常モードで再試行: {e}")
+        return pd.read_excel(file_path, engine='openpyxl', engine_kwargs={'read_only': False}, **read_excel_kwargs)
+
+
 def load_file_flexible(file_path: str, sheet_name: str = None) -> pd.DataFrame:
-    """CSV/TSV/Excelを自動判別して読み込み"""
+    """
+    CSV/TSV/Excelを自動判別して読み込み
+    
+    全列を文字列型（STRING_DTYPE）で読み込む。欠損値はpd.NAになり、比較結果も欠損になるため、
+    比較をマスクに使うときは欠損の扱い（fillna）を明示すること。
+    """
     p = Path(file_path)
     ext = p.suffix.lower()
     
@@ -53,7 +106,15 @@ def load_file_flexible(file_path: str, sheet_name: str = None) -> pd.DataFrame:
             if sheet_name is None:
                 sheet_name = 0
             
-            df = pd.read_excel(file_path, sheet_name=sheet_name, engine='openpyxl', dtype=str)
+            # calamineで読み込み、失敗した場合（マクロ付き.xlsmなど）はopenpyxlで再試行
+            df = None
+            if CALAMINE_AVAILABLE:
+                try:
+                    df = pd.read_excel(file_path, sheet_name=sheet_name, engine='calamine', dtype=STRING_DTYPE)
+                except Exception as calamine_error:
+                    print(f"⚠️ calamineでの読み込みに失敗したため、openpyxlで再試行: {calamine_error}")
+            if df is None:
+                df = read_excel_openpyxl(file_path, sheet_name=sheet_name, dtype=STRING_DTYPE)
             
             if sheet_name == 0:
                 print(f"✅ Excel読み込み成功（最初のシート）")
@@ -72,10 +133,22 @@ def load_file_flexible(file_path: str, sheet_name: str = None) -> pd.DataFrame:
     
     delimiter = delimiter_map[ext]
     
+    # 先頭部分だけ読んで、デコードできない文字コードは読み込みを試さない
+    # （末尾で文字が途切れていてもエラーにしないよう、逐次デコーダで判定）
+    with p.open('rb') as f:
+        head = f.read(ENCODING_PEEK_BYTES)
+    candidates = []
     for encoding in encodings:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+            candidates.append(encoding)
+        except UnicodeDecodeError:
+            continue
+    
+    for encoding in candidates:
         try:
             df = pd.read_csv(file_path, encoding=encoding, delimiter=delimiter, 
-                           on_bad_lines='skip', dtype=str)
+                           on_bad_lines='skip', dtype=STRING_DTYPE)
             print(f"✅ {ext}読み込み成功（{encoding}）")
             return df
         except UnicodeDecodeError:
@@ -85,6 +158,60 @@ def load_file_flexible(file_path: str, sheet_name: str = None) -> pd.DataFrame:
 
 
 
+# ========================================================================
+# ファイル出力
+# ========================================================================
+
+def write_csv_cp932(df: pd.DataFrame, file_path: Path) -> None:
+    """
+    CSVをcp932で保存
+    
+    pyarrowがあればC++実装のCSVライターでUTF-8に書き出してからcp932に変換する。
+    引用符が必要な値（カンマ・改行・ダブルクォートを含む）がある場合は、従来通りpandasで書き出す。
+    """
+    if PYARROW_AVAILABLE:
+        try:
+            buffer = pa.BufferOutputStream()
+            pa_csv.write_csv(
+                pa.Table.from_pandas(df, preserve_index=False), buffer,
+                write_options=pa_csv.WriteOptions(include_header=False, quoting_style='none', eol=os.linesep)
+            )
+            # ヘッダー行はpandasと同じ書式にする
+            text = df.head(0).to_csv(index=False) + buffer.getvalue().to_pybytes().decode('utf-8')
+            Path(file_path).write_bytes(text.encode('cp932', errors='replace'))
+            return
+        except pa.ArrowInvalid:
+            pass
+    
+    df.to_csv(file_path, index=False, encoding='cp932', errors='replace')
+
+
+def write_excel(df: pd.DataFrame, file_path: Path) -> None:
+    """
+    Excelを保存
+    
+    xlsxwriterがあればconstant_memoryモード（1行ずつ書き出し、シート全体をメモリに持たない）で保存する。
+    pandasのto_excelは列単位でセルを書くためconstant_memoryでは値が欠けるので、行単位で直接書き込む。
+    """
+    if not XLSXWRITER_AVAILABLE:
+        df.to_excel(file_path, index=False, engine='openpyxl')
+        return
+    
+    workbook = xlsxwriter.Workbook(str(file_path), {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet('Sheet1')
+        # ヘッダーはpandasのto_excelと同じ書式（太字・罫線・中央揃え）
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        worksheet.write_row(0, 0, df.columns, header_format)
+        
+        # 欠損値は空セルにする
+        values = df.astype(object).where(df.notna(), None)
+        for row_number, row in enumerate(values.itertuples(index=False, name=None), start=1):
+            worksheet.write_row(row_number, 0, row)
+    finally:
+        workbook.close()
+
+
 # ========================================================================
 # データ処理
 # ========================================================================
@@ -174,12 +301,12 @@ def split_kao_planet_list(df: pd.DataFrame) -> tuple:
     if 'データソース' not in df.columns:
         raise ValueError("データソース列が見つかりません")
     
-    # 花王データ
-    kao_df = df[df['データソース'] == '花王'].copy()
+    # 花王データ（ブールマスクでの抽出結果は元とは別のDataFrameなので、.copy()は不要）
+    kao_df = df[df['データソース'] == '花王']
     print(f"  花王: {len(kao_df)}件")
     
     # プラネットデータ
-    planet_df = df[df['データソース'] == 'プラネット'].copy()
+    planet_df = df[df['データソース'] == 'プラネット']
     print(f"  プラネット: {len(planet_df)}件")
     
     # その他（警告）
@@ -192,7 +319,27 @@ def split_kao_planet_list(df: pd.DataFrame) -> tuple:
     return kao_df, planet_df
 
 
-def update_metadata(df: pd.DataFrame, period: str, note: str = '') -> pd.DataFrame:
+def load_kao_planet_list(file_path: str) -> tuple:
+    """
+    花王・プラネットリストを読み込み、データソース列で振り分け
+    
+    Args:
+        file_path: 花王・プラネットリストのパス
+    
+    Returns:
+        (kao_df, planet_df): 花王データ、プラネットデータ
+    """
+    df = load_file_flexible(file_path)
+    df = normalize_columns(df, file_type='kao_planet')
+    
+    # データソース列チェック
+    if 'データソース' not in df.columns:
+        raise ValueError("データソース列が見つかりません")
+    
+    return split_kao_planet_list(df)
+
+
+def update_metadata(df: pd.DataFrame, period: str, note: str = '', processed_date: str = None) -> pd.DataFrame:
     """
     メタデータを更新（データソースは既に入っている前提）
     
@@ -200,6 +347,7 @@ def update_metadata(df: pd.DataFrame, period: str, note: str = '') -> pd.DataFra
         df: 入力データ（データソース列あり）
         period: 期間（例: 25年上）
         note: 新JAN備考に追加する文字列（空の場合のみ）
+        processed_date: 処理日（YYYY-MM-DD、省略時は今日）
     """
     print(f"📝 メタデータ更新中...")
     
@@ -207,20 +355,21 @@ def update_metadata(df: pd.DataFrame, period: str, note: str = '') -> pd.DataFra
     
     # 期間と処理日を更新
     df['期間'] = period
-    df['処理日'] = datetime.now().strftime('%Y-%m-%d')
+    df['処理日'] = processed_date or datetime.now().strftime('%Y-%m-%d')
     
     # 新JAN備考が空の場合のみnoteを入れる
     if note and '新JAN備考' in df.columns:
         df.loc[df['新JAN備考'].isna() | (df['新JAN備考'] == ''), '新JAN備考'] = note
     
     # カラム順を統一
-    df = df[OUTPUT_COLUMNS_EXCEL].copy()
+    df = df.reindex(columns=OUTPUT_COLUMNS_EXCEL, copy=False)
     
     print(f"✅ 処理完了: {len(df)}件")
     return df
 
 
-def add_metadata(df: pd.DataFrame, source: str, period: str = '', note: str = '') -> pd.DataFrame:
+def add_metadata(df: pd.DataFrame, source: str, period: str = '', note: str = '',
+                 processed_date: str = None) -> pd.DataFrame:
     """
     メタデータを追加（マッチング用）
     
@@ -229,6 +378,7 @@ def add_metadata(df: pd.DataFrame, source: str, period: str = '', note: str = ''
         source: データソース（マッチング）
         period: 期間（例: 25年上）
         note: 新JAN備考に追加する文字列（空の場合のみ）
+        processed_date: 処理日（YYYY-MM-DD、省略時は今日）
     """
     print(f"📝 メタデータ追加中: {source}")
     
@@ -237,36 +387,60 @@ def add_metadata(df: pd.DataFrame, source: str, period: str = '', note: str = ''
     # メタデータ追加
     df['データソース'] = source
     df['期間'] = period
-    df['処理日'] = datetime.now().strftime('%Y-%m-%d')
+    df['処理日'] = processed_date or datetime.now().strftime('%Y-%m-%d')
     
     # 新JAN備考が空の場合のみnoteを入れる
     if note and '新JAN備考' in df.columns:
         df['新JAN備考'] = df['新JAN備考'].fillna(note).replace('', note)
     
     # カラム順を統一
-    df = df[OUTPUT_COLUMNS_EXCEL].copy()
+    df = df.reindex(columns=OUTPUT_COLUMNS_EXCEL, copy=False)
     
     print(f"✅ 処理完了: {len(df)}件")
     return df
 
 
 def clean_jan_codes(df: pd.DataFrame) -> pd.DataFrame:
-    """JANコードを13桁に統一"""
+    """
+    JANコードを13桁に統一し、整数（uint64）で保持
+    
+    13桁の数字はuint64に収まるため、照合・重複判定を整数の比較で行う。
+    出力時はformat_jan_codesで13桁の文字列に戻す。
+    """
     print("🧹 JANコードクレンジング中...")
     
     jan_cols = ['旧JANコード', '新JANコード']
     
     for col in jan_cols:
         if col in df.columns:
-            df[col] = (df[col].astype(str)
-                      .str.replace(r'\D+', '', regex=True)
-                      .str.zfill(13)
-                      .str[:13])
+            if PYARROW_AVAILABLE:
+                # Arrowの関数を直接つなげて処理（途中でpandasの列を作らない）
+                # 欠損値は空文字として扱う（従来通り 0000000000000 になる）
+                # 全角数字はNFKCで半角にしてから数字以外を除去する（除去で消えないように）
+                arr = pc.fill_null(pa.array(df[col].astype(STRING_DTYPE)), '')
+                arr = pc.utf8_normalize(arr, 'NFKC')
+                arr = pc.replace_substring_regex(arr, '[^0-9]+', '')
+                arr = pc.utf8_lpad(arr, 13, '0')
+                arr = pc.utf8_slice_codeunits(arr, 0, 13)
+                df[col] = pc.cast(arr, pa.uint64()).to_numpy(zero_copy_only=False)
+            else:
+                df[col] = (df[col].astype(STRING_DTYPE).fillna('')
+                          .str.normalize('NFKC')
+                          .str.replace('[^0-9]+', '', regex=True)
+                          .str.zfill(13)
+                          .str[:13]
+                          .astype('uint64'))
     
     print("✅ クレンジング完了")
     return df
 
 
+def format_jan_codes(df: pd.DataFrame) -> pd.DataFrame:
+    """整数で保持しているJANコードを、出力用に13桁（0埋め）の文字列に戻す"""
+    jan_cols = [col for col in ['旧JANコード', '新JANコード'] if col in df.columns]
+    return df.assign(**{col: df[col].astype(str).str.zfill(13) for col in jan_cols})
+
+
 def remove_specific_source_data(existing_df: pd.DataFrame, source_name: str, periods_to_keep: list) -> pd.DataFrame:
     """
     累積リストから特定データソース（花王 or プラネット）の指定期間以外を削除
@@ -286,8 +460,8 @@ def remove_specific_source_data(existing_df: pd.DataFrame, source_name: str, per
     print(f"🗑️ 古い{source_name}データを削除中...")
     print(f"   保持する期間: {periods_to_keep}")
     
-    # 対象データソース以外はそのまま保持
-    non_target = existing_df[existing_df['データソース'] != source_name]
+    # 対象データソース以外はそのまま保持（データソースが空の行も保持）
+    non_target = existing_df[(existing_df['データソース'] != source_name).fillna(True)]
     
     # 対象データソースで保持する期間のデータ
     target_keep = existing_df[
@@ -325,19 +499,30 @@ def merge_and_deduplicate(existing_df: pd.DataFrame,
     print(f"  プラネット（今週）: {len(planet_df)}件")
     print(f"  マッチング（今週）: {len(matching_df)}件")
     
+    # ステップ0: JANコードクレンジング
+    # 4つのデータをまとめて1回で処理し、元の区切りで切り分け直す
+    # （ステップ1〜3の照合もクレンジング後のJANで行う必要があるため、統合より前に行う）
+    frames = [existing_df, kao_df, planet_df, matching_df]
+    cleaned = clean_jan_codes(pd.concat(frames, ignore_index=True, copy=False))
+    starts = [0, *accumulate(len(frame) for frame in frames)]
+    existing_df, kao_df, planet_df, matching_df = (
+        cleaned.iloc[start:end] for start, end in zip(starts, starts[1:])
+    )
+    
     # ステップ1: 累積内の花王・プラネット由来の新JANを抽出
-    existing_kao_planet_jans = set()
+    # （重複を除いたpd.Indexにしておくと、isinでハッシュ表をそのまま使える）
+    existing_kao_planet_jans = pd.Index([])
     if not existing_df.empty and 'データソース' in existing_df.columns:
         kao_planet_rows = existing_df[
             existing_df['データソース'].isin(['花王', 'プラネット'])
         ]
-        existing_kao_planet_jans = set(kao_planet_rows['新JANコード'].dropna())
+        existing_kao_planet_jans = pd.Index(kao_planet_rows['新JANコード'].dropna().unique())
         print(f"  累積内の花王・プラネット由来JAN: {len(existing_kao_planet_jans)}件")
     
     # ステップ2: マッチング結果から累積内花王・プラネット重複を削除
-    if not matching_df.empty and existing_kao_planet_jans:
+    if not matching_df.empty and not existing_kao_planet_jans.empty:
         before = len(matching_df)
-        matching_df = matching_df[~matching_df['新JANコード'].isin(existing_kao_planet_jans)].copy()
+        matching_df = matching_df[~matching_df['新JANコード'].isin(existing_kao_planet_jans)]
         removed = before - len(matching_df)
         if removed > 0:
             print(f"  ✂️ マッチング→累積内花王・プラネット重複削除: {removed}件")
@@ -345,9 +530,9 @@ def merge_and_deduplicate(existing_df: pd.DataFrame,
     # ステップ2.5: 今週マッチングと「完全一致」する累積内マッチングを削除
     if not existing_df.empty and not matching_df.empty and 'データソース' in existing_df.columns:
         # 累積内のマッチングデータのみを抽出（先に分離）
-        mask_matching = existing_df['データソース'] == 'マッチング'
-        existing_matching = existing_df[mask_matching].copy()
-        existing_others = existing_df[~mask_matching].copy()
+        mask_matching = (existing_df['データソース'] == 'マッチング').fillna(False)
+        existing_matching = existing_df[mask_matching]
+        existing_others = existing_df[~mask_matching]
         
         # 今週マッチングのレコード（旧JAN+新JANのペア）
         this_week_pairs = set(zip(matching_df['旧JANコード'], matching_df['新JANコード']))
@@ -363,7 +548,7 @@ def merge_and_deduplicate(existing_df: pd.DataFrame,
                     lambda row: (row['旧JANコード'], row['新JANコード']) in duplicate_pairs, 
                     axis=1
                 )
-                existing_matching = existing_matching[mask_keep].copy()
+                existing_matching = existing_matching[mask_keep]
                 
                 removed = before - len(existing_matching)
                 print(f"  ✂️ 累積内マッチング→今週マッチング完全一致削除: {removed}件")
@@ -373,33 +558,36 @@ def merge_and_deduplicate(existing_df: pd.DataFrame,
         existing_df = pd.concat([existing_others, existing_matching], ignore_index=True)
     
     # ステップ3: 今週の花王・プラネットとマッチングの重複削除
-    new_kao_planet_df = pd.concat([kao_df, planet_df], ignore_index=True)
+    new_kao_planet_df = pd.concat([kao_df, planet_df], ignore_index=True, copy=False)
     
     if not new_kao_planet_df.empty and not matching_df.empty:
-        kao_planet_old_jans = set(new_kao_planet_df['旧JANコード'].dropna())
-        kao_planet_new_jans = set(new_kao_planet_df['新JANコード'].dropna())
+        kao_planet_old_jans = pd.Index(new_kao_planet_df['旧JANコード'].dropna().unique())
+        kao_planet_new_jans = pd.Index(new_kao_planet_df['新JANコード'].dropna().unique())
         
         before = len(matching_df)
-        matching_df = matching_df[~matching_df['新JANコード'].isin(kao_planet_new_jans)].copy()
-        matching_df = matching_df[~matching_df['旧JANコード'].isin(kao_planet_old_jans)].copy()
+        # 新JAN・旧JANの条件は1つのマスクにまとめて、1回の抽出で済ませる
+        matching_df = matching_df[
+            ~matching_df['新JANコード'].isin(kao_planet_new_jans) & ~matching_df['旧JANコード'].isin(kao_planet_old_jans)
+        ]
         removed = before - len(matching_df)
         if removed > 0:
             print(f"  ✂️ マッチング→今週花王・プラネット重複削除: {removed}件")
     
     # ステップ4: データ結合（優先順位順）
-    all_data = pd.concat([existing_df, kao_df, planet_df, matching_df], ignore_index=True)
+    all_data = pd.concat([existing_df, kao_df, planet_df, matching_df], ignore_index=True, copy=False)
     print(f"  統合後: {len(all_data)}件")
     
     # ステップ5: 新JANで重複削除（先頭優先）
+    # 新JAN列だけをハッシュして2回目以降の出現をマスクし、残す行を1回で抽出
     before = len(all_data)
-    all_data = all_data.drop_duplicates(subset=['新JANコード'], keep='first')
+    all_data = all_data[~all_data['新JANコード'].duplicated(keep='first')]
     removed = before - len(all_data)
     if removed > 0:
         print(f"  🗑️ 新JAN重複削除: {removed}件")
     
     # ステップ6: 旧JAN=新JANの同一JANを削除
     before = len(all_data)
-    all_data = all_data[all_data['旧JANコード'] != all_data['新JANコード']].copy()
+    all_data = all_data[all_data['旧JANコード'] != all_data['新JANコード']]
     removed = before - len(all_data)
     if removed > 0:
         print(f"  🔄 同一JAN削除: {removed}件")
@@ -408,6 +596,93 @@ def merge_and_deduplicate(existing_df: pd.DataFrame,
     return all_data
 
 
+# ========================================================================
+# 入力フォーム
+# ========================================================================
+
+def ask_source_periods(parent: tk.Misc, load_future: Future) -> dict:
+    """
+    花王・プラネットの期間と保持期間を1つのフォームでまとめて入力
+    
+    フォームを開いている間もload_futureの読み込みは裏で進み、終わると件数を表示する。
+    読み込みに失敗した場合はフォームを閉じる（エラーは呼び出し元でresult()から受け取る）。
+    
+    Args:
+        parent: 親ウィンドウ
+        load_future: 花王・プラネットリストの読み込み（結果は(kao_df, planet_df)）
+    
+    Returns:
+        kao_period, kao_keep, planet_period, planet_keep の入力値（キャンセル時はすべてNone）
+    """
+    sections = [
+        ('kao', '花王', '25年下,26年上'),
+        ('planet', 'プラネット', '25年上,25年下'),
+    ]
+    result = {f'{source}_{field}': None for source, _, _ in sections for field in ('period', 'keep')}
+    
+    top = tk.Toplevel(parent)
+    top.title("花王・プラネット期間入力")
+    top.resizable(False, False)
+    
+    status = tk.Label(top, text="⏳ 花王・プラネットリスト読み込み中...")
+    status.grid(row=0, column=0, columnspan=2, sticky='w', padx=10, pady=(10, 5))
+    
+    variables = {}
+    row = 1
+    for source, name, default in sections:
+        period_var = tk.StringVar(top, value=default)
+        keep_var = tk.StringVar(top, value=default)
+        
+        # 保持期間を書き換えていなければ、期間の入力に合わせる（期間を保持期間の初期値にしていた従来の動き）
+        def follow_period(*_, period_var=period_var, keep_var=keep_var, last=[default]):
+            if keep_var.get() == last[0]:
+                keep_var.set(period_var.get())
+            last[0] = period_var.get()
+        
+        period_var.trace_add('write', follow_period)
+        
+        tk.Label(top, text=f"{name}リストの期間（例: {default}）").grid(row=row, column=0, sticky='w', padx=10)
+        tk.Entry(top, textvariable=period_var, width=30).grid(row=row, column=1, padx=10, pady=2)
+        tk.Label(top, text=f"累積から保持する{name}の期間（この期間以外は削除・空欄で全削除）").grid(
+            row=row + 1, column=0, sticky='w', padx=10)
+        tk.Entry(top, textvariable=keep_var, width=30).grid(row=row + 1, column=1, padx=10, pady=(2, 8))
+        
+        variables[f'{source}_period'] = period_var
+        variables[f'{source}_keep'] = keep_var
+        row += 2
+    
+    def on_ok():
+        result.update({key: var.get() for key, var in variables.items()})
+        top.destroy()
+    
+    buttons = tk.Frame(top)
+    buttons.grid(row=row, column=0, columnspan=2, pady=(0, 10))
+    tk.Button(buttons, text="OK", width=10, command=on_ok).pack(side='left', padx=5)
+    tk.Button(buttons, text="キャンセル", width=10, command=top.destroy).pack(side='left', padx=5)
+    top.bind('<Return>', lambda _: on_ok())
+    
+    # 読み込みが終わったら件数を表示
+    def poll_load():
+        if not top.winfo_exists():
+            return
+        if not load_future.done():
+            top.after(100, poll_load)
+            return
+        if load_future.exception() is not None:
+            top.destroy()
+            return
+        kao_df, planet_df = load_future.result()
+        status.config(text=f"✅ 読み込んだデータ: 花王 {len(kao_df)}件 / プラネット {len(planet_df)}件")
+    
+    top.wait_visibility()
+    top.grab_set()
+    top.focus_force()
+    # 最初の確認はwait_window中に行う（読み込みが既に失敗していてもウィンドウを閉じるだけで済むように）
+    top.after(100, poll_load)
+    top.wait_window()
+    return result
+
+
 # ========================================================================
 # メイン処理
 # ========================================================================
@@ -417,6 +692,9 @@ def main():
     print("累積リスト統合プログラム - 週次更新（v5.1・花王/プラネット自動振り分け版）")
     print("=" * 60)
     
+    # 処理日は実行中ずっと同じなので、最初に1回だけ求めておく
+    processed_date = datetime.now().strftime('%Y-%m-%d')
+    
     # ========== ステップ1: 累積リスト読み込み ==========
     print("\n【ステップ1】累積リストの読み込み")
     
@@ -434,7 +712,6 @@ def main():
         if existing_path:
             try:
                 existing_df = load_file_flexible(existing_path)  # sheet_name=Noneがデフォルト
-                existing_df = clean_jan_codes(existing_df)
                 print(f"✅ 累積リスト読み込み: {len(existing_df)}件")
             except Exception as e:
                 messagebox.showerror("エラー", f"累積リスト読み込み失敗:\n{e}")
@@ -470,9 +747,9 @@ def main():
         matching_df = add_metadata(
             matching_df, 
             source='マッチング',
-            note=Path(matching_path).name
+            note=Path(matching_path).name,
+            processed_date=processed_date
         )
-        matching_df = clean_jan_codes(matching_df)
         print(f"✅ マッチング結果読み込み: {len(matching_df)}件")
     except Exception as e:
         messagebox.showerror("エラー", f"マッチング結果読み込み失敗:\n{e}")
@@ -504,40 +781,23 @@ def main():
         if not kao_planet_path:
             messagebox.showwarning("キャンセル", "花王・プラネットリストが選択されませんでした")
         else:
+            # 期間入力フォームを開いている間に、裏でファイルを読み込んでおく
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                load_future = executor.submit(load_kao_planet_list, kao_planet_path)
+                periods = ask_source_periods(root, load_future)
+            
             try:
-                # ファイル読み込み
-                kao_planet_df = load_file_flexible(kao_planet_path)
-                kao_planet_df = normalize_columns(kao_planet_df, file_type='kao_planet')
-                kao_planet_df = clean_jan_codes(kao_planet_df)
-                
-                # データソース列チェック
-                if 'データソース' not in kao_planet_df.columns:
-                    raise ValueError("データソース列が見つかりません")
-                
-                # 花王とプラネットに振り分け
-                kao_df, planet_df = split_kao_planet_list(kao_planet_df)
+                kao_df, planet_df = load_future.result()
                 
                 # 花王の期間設定
                 if not kao_df.empty:
-                    kao_period = simpledialog.askstring(
-                        "花王期間入力",
-                        f"花王リストの期間を入力してください\n（例: 25年下,26年上）\n\n"
-                        f"読み込んだ花王データ: {len(kao_df)}件",
-                        initialvalue="25年下,26年上"
-                    )
+                    kao_period = periods['kao_period']
                     
                     if not kao_period:
                         kao_period = datetime.now().strftime('%Y年')
                     
                     # 保持する期間
-                    kao_keep_periods_str = simpledialog.askstring(
-                        "花王保持期間",
-                        "累積から保持する花王の期間をカンマ区切りで入力\n"
-                        "（例: 25年下,26年上）\n\n"
-                        "※この期間以外の花王データは削除されます\n"
-                        "※空欄で花王データ全削除してから新規追加",
-                        initialvalue=kao_period
-                    )
+                    kao_keep_periods_str = periods['kao_keep']
                     
                     if kao_keep_periods_str:
                         kao_periods_to_keep = [p.strip() for p in kao_keep_periods_str.split(',')]
@@ -548,30 +808,18 @@ def main():
                     existing_df = remove_specific_source_data(existing_df, '花王', kao_periods_to_keep)
                     
                     # メタデータ更新
-                    kao_df = update_metadata(kao_df, kao_period, Path(kao_planet_path).name)
+                    kao_df = update_metadata(kao_df, kao_period, Path(kao_planet_path).name, processed_date)
                     print(f"✅ 花王データ処理完了: {len(kao_df)}件")
                 
                 # プラネットの期間設定
                 if not planet_df.empty:
-                    planet_period = simpledialog.askstring(
-                        "プラネット期間入力",
-                        f"プラネットリストの期間を入力してください\n（例: 25年上,25年下）\n\n"
-                        f"読み込んだプラネットデータ: {len(planet_df)}件",
-                        initialvalue="25年上,25年下"
-                    )
+                    planet_period = periods['planet_period']
                     
                     if not planet_period:
                         planet_period = datetime.now().strftime('%Y年')
                     
                     # 保持する期間
-                    planet_keep_periods_str = simpledialog.askstring(
-                        "プラネット保持期間",
-                        "累積から保持するプラネットの期間をカンマ区切りで入力\n"
-                        "（例: 25年上,25年下）\n\n"
-                        "※この期間以外のプラネットデータは削除されます\n"
-                        "※空欄でプラネットデータ全削除してから新規追加",
-                        initialvalue=planet_period
-                    )
+                    planet_keep_periods_str = periods['planet_keep']
                     
                     if planet_keep_periods_str:
                         planet_periods_to_keep = [p.strip() for p in planet_keep_periods_str.split(',')]
@@ -582,7 +830,7 @@ def main():
                     existing_df = remove_specific_source_data(existing_df, 'プラネット', planet_periods_to_keep)
                     
                     # メタデータ更新
-                    planet_df = update_metadata(planet_df, planet_period, Path(kao_planet_path).name)
+                    planet_df = update_metadata(planet_df, planet_period, Path(kao_planet_path).name, processed_date)
                     print(f"✅ プラネットデータ処理完了: {len(planet_df)}件")
                 
             except Exception as e:
@@ -620,6 +868,7 @@ def main():
     print("\n【ステップ5】データ統合・重複削除")
     
     final_df = merge_and_deduplicate(existing_df, kao_df, planet_df, matching_df)
+    output_df = format_jan_codes(final_df)
     
     # ========== ステップ6: 保存 ==========
     print("\n【ステップ6】ファイル保存")
@@ -627,13 +876,16 @@ def main():
     try:
         # CSV（システム読み込み用: メタデータなし）
         print(f"💾 CSV保存中（システム用・cp932）: {output_csv.name}")
-        final_df[OUTPUT_COLUMNS_CSV].to_csv(output_csv, index=False, encoding='cp932', errors='replace')
-        final_df[OUTPUT_COLUMNS_CSV].to_csv(latest_csv, index=False, encoding='cp932', errors='replace')
+        write_csv_cp932(output_df[OUTPUT_COLUMNS_CSV], output_csv)
         
         # Excel（管理用: メタデータあり）
         print(f"💾 Excel保存中（管理用・全カラム）: {output_excel.name}")
-        final_df[OUTPUT_COLUMNS_EXCEL].to_excel(output_excel, index=False, engine='openpyxl')
-        final_df[OUTPUT_COLUMNS_EXCEL].to_excel(latest_excel, index=False, engine='openpyxl')
+        write_excel(output_df[OUTPUT_COLUMNS_EXCEL], output_excel)
+        
+        # 「_最新」は中身が同じなので、書き出し直さずにファイルをコピー
+        # （ハードリンクだと「_最新」を編集したときに日付付きの控えまで変わってしまうため、コピーにする）
+        shutil.copyfile(output_csv, latest_csv)
+        shutil.copyfile(output_excel, latest_excel)
         
         print("✅ 保存完了")
     except Exception as e:
@@ -19,11 +19,40 @@ Author: HIBI KEITA
 Version: 3.0
 """
 
+import os
+import re
+import shutil
+import unicodedata
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog
+from tkinter import filedialog, messagebox
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# Excelの高速読み込み用（Rust製のcalamine）。無ければopenpyxlで読み込む
+try:
+    import python_calamine
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+# CSVの高速書き出し・JANコードの一括整形用（C++実装）。無ければpandas・Pythonで処理
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Excel出力用（xlsxwriter）。無ければopenpyxlで出力
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
 
 
 # ========================================================================
@@ -75,6 +104,12 @@ OUTPUT_COLUMN_MAPPING = {
     '処理日': '処理日',
 }
 
+# JANコードから数字以外を除去するパターン
+NON_DIGIT_PATTERN = re.compile(r'\D+')
+
+# 同じ除去をpyarrow（RE2）で行うパターン（RE2の\DはASCIIの数字しか数字扱いしないため、Unicodeの数字で指定）
+NON_DIGIT_PATTERN_RE2 = r'\P{Nd}+'
+
 # ========================================================================
 # ファイル読み込み関数
 # ========================================================================
@@ -88,7 +123,15 @@ def load_file_flexible(file_path: str) -> pd.DataFrame:
     
     if ext in ['.xlsx', '.xls', '.xlsm']:
         try:
-            df = pd.read_excel(file_path, engine='openpyxl', dtype=str)
+            # calamineで読み込み、失敗した場合（マクロ付き.xlsmなど）はopenpyxlで再試行
+            df = None
+            if CALAMINE_AVAILABLE:
+                try:
+                    df = pd.read_excel(file_path, engine='calamine', dtype=str)
+                except Exception as calamine_error:
+                    print(f"⚠️ calamineでの読み込みに失敗したため、openpyxlで再試行: {calamine_error}")
+            if df is None:
+                df = pd.read_excel(file_path, engine='openpyxl', dtype=str)
             print(f"✅ Excel読み込み成功")
             return df
         except Exception as e:
@@ -114,6 +157,60 @@ def load_file_flexible(file_path: str) -> pd.DataFrame:
     raise UnicodeDecodeError(f"すべてのエンコーディングで読み込み失敗")
 
 
+# ========================================================================
+# ファイル出力関数
+# ========================================================================
+
+def write_csv_cp932(df: pd.DataFrame, file_path: Path) -> None:
+    """
+    CSVをcp932で保存（cp932にない文字は?に置換）
+    
+    pyarrowがあればC++実装のCSVライターでUTF-8に書き出してからcp932に変換する。
+    引用符が必要な値（カンマ・改行・ダブルクォートを含む）がある場合は、従来通りpandasで書き出す。
+    """
+    if PYARROW_AVAILABLE:
+        try:
+            buffer = pa.BufferOutputStream()
+            pa_csv.write_csv(
+                pa.Table.from_pandas(df, preserve_index=False), buffer,
+                write_options=pa_csv.WriteOptions(include_header=False, quoting_style='none', eol=os.linesep)
+            )
+            # ヘッダー行はpandasと同じ書式にする
+            text = df.head(0).to_csv(index=False) + buffer.getvalue().to_pybytes().decode('utf-8')
+            Path(file_path).write_bytes(text.encode('cp932', errors='replace'))
+            return
+        except pa.ArrowInvalid:
+            pass
+    
+    df.to_csv(file_path, index=False, encoding='cp932', errors='replace')
+
+
+def write_excel(df: pd.DataFrame, file_path: Path) -> None:
+    """
+    Excelを保存
+    
+    xlsxwriterがあればconstant_memoryモード（1行ずつ書き出し、シート全体をメモリに持たない）で保存する。
+    pandasのto_excelは列単位でセルを書くためconstant_memoryでは値が欠けるので、行単位で直接書き込む。
+    """
+    if not XLSXWRITER_AVAILABLE:
+        df.to_excel(file_path, index=False, engine='openpyxl')
+        return
+    
+    workbook = xlsxwriter.Workbook(str(file_path), {'constant_memory': True})
+    try:
+        worksheet = workbook.add_worksheet('Sheet1')
+        # ヘッダーはpandasのto_excelと同じ書式（太字・罫線・中央揃え）
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        worksheet.write_row(0, 0, df.columns, header_format)
+        
+        # 欠損値は空セルにする
+        values = df.astype(object).where(df.notna(), None)
+        for row_number, row in enumerate(values.itertuples(index=False, name=None), start=1):
+            worksheet.write_row(row_number, 0, row)
+    finally:
+        workbook.close()
+
+
 # ========================================================================
 # 花王・プラネット用正規化（マッチング結果の形式に合わせる）
 # ========================================================================
@@ -156,7 +253,9 @@ def normalize_kao_planet(df: pd.DataFrame, file_name: str, period: str) -> pd.Da
         if col not in df_normalized.columns:
             df_normalized[col] = ''
     
-    df_normalized = df_normalized[output_cols].copy()
+    # JANコードもここで整形（並び替えの前に済ませるので、並び替え後の.copy()は不要）
+    df_normalized = clean_jan_codes(df_normalized)
+    df_normalized = df_normalized[output_cols]
     
     print(f"✅ 正規化完了: {len(df_normalized)}件")
     return df_normalized
@@ -196,6 +295,9 @@ def normalize_matching(df: pd.DataFrame, file_name: str) -> pd.DataFrame:
     if INTERNAL_COLUMNS['note'] not in df_normalized.columns:
         df_normalized[INTERNAL_COLUMNS['note']] = file_name
     
+    # JANコードもここで整形
+    df_normalized = clean_jan_codes(df_normalized)
+    
     print(f"✅ 正規化完了: {len(df_normalized)}件")
     return df_normalized
 
@@ -210,12 +312,29 @@ def clean_jan_codes(df: pd.DataFrame) -> pd.DataFrame:
     
     jan_cols = [INTERNAL_COLUMNS['jan_old'], INTERNAL_COLUMNS['jan_new']]
     
+    # .strメソッドを4回つなげると途中のSeriesが毎回作られるため、
+    # pyarrowがあればArrowの関数、無ければ1回のループでまとめて処理
+    sub = NON_DIGIT_PATTERN.sub
+    normalize = unicodedata.normalize
+    
     for col in jan_cols:
         if col in df.columns:
-            df[col] = (df[col].astype(str)
-                      .str.replace(r'\D+', '', regex=True)
-                      .str.zfill(13)
-                      .str[:13])
+            if PYARROW_AVAILABLE:
+                # 文字列の列はそのままArrowに渡す（欠損値は空文字扱い。'nan'から数字を除いた結果と同じ）
+                # 数値などが混ざっている場合だけ文字列に変換する
+                try:
+                    arr = pc.fill_null(pa.array(df[col].to_numpy(), type=pa.string(), from_pandas=True), '')
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    arr = pa.array(df[col].astype(str).to_numpy(), type=pa.string())
+                # 全角数字はNFKCで半角にそろえる（他のスクリプトと同じく13桁の半角数字で出力するため）
+                arr = pc.utf8_normalize(arr, 'NFKC')
+                arr = pc.replace_substring_regex(arr, NON_DIGIT_PATTERN_RE2, '')
+                arr = pc.utf8_lpad(arr, 13, '0')
+                arr = pc.utf8_slice_codeunits(arr, 0, 13)
+                df[col] = arr.to_numpy(zero_copy_only=False)
+            else:
+                # str()は文字列ならそのまま返すので、列全体をastype(str)で作り直さない
+                df[col] = np.array([sub('', normalize('NFKC', str(s))).zfill(13)[:13] for s in df[col].to_numpy()], dtype=object)
     
     print("✅ クレンジング完了")
     return df
@@ -225,6 +344,23 @@ def clean_jan_codes(df: pd.DataFrame) -> pd.DataFrame:
 # 累積から古い花王・プラネットデータを削除
 # ========================================================================
 
+def kao_planet_source_mask(source: pd.Series) -> np.ndarray:
+    """
+    データソースが花王・プラネット由来（「花王」か「プラネット」を含む）かどうかのマスク
+    
+    2つの部分文字列を調べるだけなので、正規表現（.str.contains）は使わず in で判定する。
+    カテゴリ型の場合は種類ごとに1回だけ判定し、各行へはコードで引き当てる。
+    """
+    if isinstance(source.dtype, pd.CategoricalDtype):
+        categories = source.cat.categories
+        hit = np.fromiter(('花王' in s or 'プラネット' in s for s in categories), dtype=bool, count=len(categories))
+        # 欠損値のコードは-1なので、末尾にFalseを足して「該当なし」に引き当てる
+        return np.append(hit, False)[source.cat.codes.to_numpy()]
+    
+    values = source.fillna('').to_numpy()
+    return np.fromiter(('花王' in s or 'プラネット' in s for s in values), dtype=bool, count=len(values))
+
+
 def remove_old_kao_planet(existing_df: pd.DataFrame, periods_to_keep: list) -> pd.DataFrame:
     """
     累積リストから指定期間以外の花王・プラネットデータを削除
@@ -239,8 +375,8 @@ def remove_old_kao_planet(existing_df: pd.DataFrame, periods_to_keep: list) -> p
     if existing_df.empty:
         return existing_df
     
-    source_col = UNIFIED_COLUMNS['source']
-    period_col = UNIFIED_COLUMNS['period']
+    source_col = INTERNAL_COLUMNS['source']
+    period_col = INTERNAL_COLUMNS['period']
     
     if source_col not in existing_df.columns or period_col not in existing_df.columns:
         print("⚠️ データソース/期間列がないため、削除処理をスキップ")
@@ -249,27 +385,24 @@ def remove_old_kao_planet(existing_df: pd.DataFrame, periods_to_keep: list) -> p
     print(f"🗑️ 古い花王・プラネットデータを削除中...")
     print(f"   保持する期間: {periods_to_keep}")
     
+    # 花王・プラネット由来かどうかの判定は1回だけ行い、マスクを使い回す
+    kp_mask = kao_planet_source_mask(existing_df[source_col])
+    
     # 花王・プラネット以外のデータはそのまま保持
-    non_kao_planet = existing_df[
-        ~existing_df[source_col].str.contains('花王|プラネット', case=False, na=False, regex=True)
-    ]
+    non_kao_planet = existing_df[~kp_mask]
     
     # 花王・プラネットで保持する期間のデータ
-    kao_planet_keep = existing_df[
-        existing_df[source_col].str.contains('花王|プラネット', case=False, na=False, regex=True) &
-        existing_df[period_col].isin(periods_to_keep)
-    ]
+    kao_planet_keep = existing_df[kp_mask & existing_df[period_col].isin(periods_to_keep)]
     
     # 削除される件数を計算
-    kao_planet_all = existing_df[
-        existing_df[source_col].str.contains('花王|プラネット', case=False, na=False, regex=True)
-    ]
-    removed_count = len(kao_planet_all) - len(kao_planet_keep)
+    removed_count = kp_mask.sum() - len(kao_planet_keep)
     
     if removed_count > 0:
         print(f"   削除: {removed_count}件")
     
-    result = pd.concat([non_kao_planet, kao_planet_keep], ignore_index=True)
+    # 空の方は結合から外す（両方空ならそのまま結合）
+    frames = [non_kao_planet, kao_planet_keep]
+    result = pd.concat([df for df in frames if not df.empty] or frames, ignore_index=True, copy=False)
     print(f"✅ 削除後: {len(result)}件")
     
     return result
@@ -289,125 +422,210 @@ def remove_duplicates_advanced(existing_df: pd.DataFrame,
     """
     print("\n📦 データ統合・重複削除開始...")
     
-    jan_old = UNIFIED_COLUMNS['jan_old']
-    jan_new = UNIFIED_COLUMNS['jan_new']
-    source_col = UNIFIED_COLUMNS['source']
+    jan_old = INTERNAL_COLUMNS['jan_old']
+    jan_new = INTERNAL_COLUMNS['jan_new']
+    source_col = INTERNAL_COLUMNS['source']
     
     print(f"  累積データ: {len(existing_df)}件")
     print(f"  花王・プラネット（今週）: {len(kao_planet_df)}件")
     print(f"  マッチング（今週）: {len(matching_df)}件")
     
     # ステップ1: 累積内の花王・プラネット由来JANを抽出
-    existing_kao_planet_jans = set()
+    # （重複を除いたpd.Indexにしておくと、isinでPythonの集合を経由せずハッシュ表で照合できる）
+    existing_kao_planet_jans = pd.Index([])
     if not existing_df.empty and source_col in existing_df.columns:
-        kao_planet_rows = existing_df[
-            existing_df[source_col].str.contains('花王|プラネット', case=False, na=False, regex=True)
-        ]
-        existing_kao_planet_jans = set(kao_planet_rows[jan_new].dropna())
+        kao_planet_rows = existing_df[kao_planet_source_mask(existing_df[source_col])]
+        existing_kao_planet_jans = pd.Index(kao_planet_rows[jan_new].dropna().unique())
         print(f"  累積内の花王・プラネット由来JAN: {len(existing_kao_planet_jans)}件")
     
-    # ステップ2: マッチング結果から累積内花王・プラネット重複を削除
-    if not matching_df.empty and existing_kao_planet_jans:
-        before = len(matching_df)
-        matching_df = matching_df[~matching_df[jan_new].isin(existing_kao_planet_jans)].copy()
-        removed = before - len(matching_df)
-        if removed > 0:
-            print(f"  ✂️ マッチング→累積内花王・プラネット重複削除: {removed}件")
-    
-    # ステップ3: 今週の花王・プラネットとマッチングの重複削除
-    if not kao_planet_df.empty and not matching_df.empty:
-        kao_planet_old_jans = set(kao_planet_df[jan_old].dropna())
-        kao_planet_new_jans = set(kao_planet_df[jan_new].dropna())
+    # ステップ2・3はマスクだけ作り、マッチング結果の抽出は最後に1回で行う
+    if not matching_df.empty:
+        drop_mask = pd.Series(False, index=matching_df.index)
+        
+        # ステップ2: マッチング結果から累積内花王・プラネット重複を削除
+        if not existing_kao_planet_jans.empty:
+            in_existing = matching_df[jan_new].isin(existing_kao_planet_jans)
+            removed = in_existing.sum()
+            if removed > 0:
+                print(f"  ✂️ マッチング→累積内花王・プラネット重複削除: {removed}件")
+            drop_mask |= in_existing
+        
+        # ステップ3: 今週の花王・プラネットとマッチングの重複削除
+        if not kao_planet_df.empty:
+            kao_planet_old_jans = pd.Index(kao_planet_df[jan_old].dropna().unique())
+            kao_planet_new_jans = pd.Index(kao_planet_df[jan_new].dropna().unique())
+            
+            in_kao_planet = (matching_df[jan_new].isin(kao_planet_new_jans) |
+                             matching_df[jan_old].isin(kao_planet_old_jans))
+            # ステップ2で削除済みの行は数えない
+            removed = (in_kao_planet & ~drop_mask).sum()
+            if removed > 0:
+                print(f"  ✂️ マッチング→今週花王・プラネット重複削除: {removed}件")
+            drop_mask |= in_kao_planet
         
-        before = len(matching_df)
-        matching_df = matching_df[~matching_df[jan_new].isin(kao_planet_new_jans)].copy()
-        matching_df = matching_df[~matching_df[jan_old].isin(kao_planet_old_jans)].copy()
-        removed = before - len(matching_df)
-        if removed > 0:
-            print(f"  ✂️ マッチング→今週花王・プラネット重複削除: {removed}件")
+        matching_df = matching_df[~drop_mask]
     
     # ステップ4: データ結合（優先順位順）
-    all_data = pd.concat([existing_df, kao_planet_df, matching_df], ignore_index=True)
+    # 空のデータ（新規作成モードの累積など）は結合から外す（すべて空ならそのまま結合）
+    frames = [existing_df, kao_planet_df, matching_df]
+    all_data = pd.concat([df for df in frames if not df.empty] or frames, ignore_index=True, copy=False)
     print(f"  統合後: {len(all_data)}件")
     
+    # ステップ5・6はマスクだけ作り、統合データの抽出は最後に1回で行う
+    # （結合順がそのまま優先順位なので、並べ替えずにkeep='first'で先頭を残せばよい）
+    duplicated = all_data[jan_new].duplicated(keep='first')
+    same_jan = all_data[jan_old] == all_data[jan_new]
+    
     # ステップ5: 新JANで重複削除
-    before = len(all_data)
-    all_data = all_data.drop_duplicates(subset=[jan_new], keep='first')
-    removed = before - len(all_data)
+    removed = duplicated.sum()
     if removed > 0:
         print(f"  🗑️ 新JAN重複削除: {removed}件")
     
-    # ステップ6: 旧JAN=新JANのものを削除
-    before = len(all_data)
-    all_data = all_data[all_data[jan_old] != all_data[jan_new]].copy()
-    removed = before - len(all_data)
+    # ステップ6: 旧JAN=新JANのものを削除（ステップ5で削除済みの行は数えない）
+    removed = (same_jan & ~duplicated).sum()
     if removed > 0:
         print(f"  🔄 同一JAN削除: {removed}件")
     
+    all_data = all_data[~(duplicated | same_jan)]
+    
     print(f"  ✅ 最終件数: {len(all_data)}件")
     return all_data
 
 
+# ========================================================================
+# 入力フォーム
+# ========================================================================
+
+def ask_inputs(parent: tk.Misc) -> dict:
+    """
+    週次更新の入力（ファイル・期間・保存先）を1つのフォームでまとめて受け付ける
+    
+    Args:
+        parent: 親ウィンドウ
+    
+    Returns:
+        existing_path, matching_path, kao_planet_path, period, keep_periods, output_dir の入力値
+        （キャンセル時はNone）
+    """
+    top = tk.Toplevel(parent)
+    top.title("累積リスト統合 - 週次更新")
+    top.resizable(False, False)
+    
+    file_types = [("Excel/CSV", "*.xlsx *.csv"), ("すべて", "*.*")]
+    matching_file_types = [("Excel/CSV", "*.xlsx *.csv *.tsv"), ("すべて", "*.*")]
+    
+    # (キー, ラベル, 初期値, 「参照...」で開くダイアログ)
+    fields = [
+        ('existing_path', "前週の累積リスト（初回は空欄）", '',
+         lambda: filedialog.askopenfilename(parent=top, title="前週の累積リストを選択", filetypes=file_types)),
+        ('matching_path', "今週のマッチング結果", '',
+         lambda: filedialog.askopenfilename(parent=top, title="マッチング結果を選択", filetypes=matching_file_types)),
+        ('kao_planet_path', "花王・プラネット差し替えリスト（更新しない週は空欄）", '',
+         lambda: filedialog.askopenfilename(parent=top, title="花王・プラネット差し替えリストを選択", filetypes=file_types)),
+        ('period', "花王・プラネットの期間（例: 25年上、25年下）", "25年上", None),
+        ('keep_periods', "累積から保持する期間（カンマ区切り・空欄で全削除）", "24年下,25年上", None),
+        ('output_dir', "保存先フォルダ", '',
+         lambda: filedialog.askdirectory(parent=top, title="保存先フォルダを選択")),
+    ]
+    
+    variables = {}
+    for row, (key, label, default, browse) in enumerate(fields):
+        variables[key] = tk.StringVar(top, value=default)
+        tk.Label(top, text=label).grid(row=row, column=0, sticky='w', padx=10, pady=2)
+        tk.Entry(top, textvariable=variables[key], width=50).grid(row=row, column=1, padx=5, pady=2)
+        
+        if browse is not None:
+            def on_browse(var=variables[key], browse=browse):
+                selected = browse()
+                if selected:
+                    var.set(selected)
+            
+            tk.Button(top, text="参照...", command=on_browse).grid(row=row, column=2, padx=(0, 10), pady=2)
+    
+    result = {}
+    
+    def on_ok():
+        values = {key: var.get().strip() for key, var in variables.items()}
+        
+        # 必須項目（マッチング結果・保存先）が空ならフォームを閉じない
+        if not values['matching_path']:
+            messagebox.showwarning("入力不足", "マッチング結果を選択してください", parent=top)
+            return
+        if not values['output_dir']:
+            messagebox.showwarning("入力不足", "保存先フォルダを選択してください", parent=top)
+            return
+        
+        result.update(values)
+        top.destroy()
+    
+    buttons = tk.Frame(top)
+    buttons.grid(row=len(fields), column=0, columnspan=3, pady=10)
+    tk.Button(buttons, text="OK", width=10, command=on_ok).pack(side='left', padx=5)
+    tk.Button(buttons, text="キャンセル", width=10, command=top.destroy).pack(side='left', padx=5)
+    
+    top.wait_visibility()
+    top.grab_set()
+    top.focus_force()
+    top.wait_window()
+    return result or None
+
+
 # ========================================================================
 # メイン処理
 # ========================================================================
 
 def main():
+    # Tkのルートウィンドウは1つだけ作り、全ダイアログで使い回す
+    root = tk.Tk()
+    root.withdraw()
+    try:
+        run_weekly_update(root)
+    finally:
+        root.destroy()
+
+
+def run_weekly_update(root: tk.Tk):
+    """週次更新の各ステップ（ダイアログはmainで作ったルートウィンドウを親として表示される）"""
     print("=" * 60)
     print("累積リスト統合プログラム - 週次更新（v3）")
     print("=" * 60)
     
+    # ========== 入力（ファイル・期間・保存先をまとめて入力） ==========
+    inputs = ask_inputs(root)
+    
+    if inputs is None:
+        print("❌ キャンセルされました")
+        return
+    
     # ========== ステップ1: 累積リスト読み込み ==========
     print("\n【ステップ1】累積リストの読み込み")
     
-    root = tk.Tk()
-    root.withdraw()
-    
     existing_df = pd.DataFrame()
+    existing_path = inputs['existing_path']
     
-    if messagebox.askyesno("累積リスト", "前週の累積リストがありますか？\n（初回は「いいえ」）"):
-        existing_path = filedialog.askopenfilename(
-            title="前週の累積リストを選択",
-            filetypes=[("Excel/CSV", "*.xlsx *.csv"), ("すべて", "*.*")]
-        )
-        
-        if existing_path:
-            try:
-                existing_df = load_file_flexible(existing_path)
-                existing_df = clean_jan_codes(existing_df)
-                print(f"✅ 累積リスト読み込み: {len(existing_df)}件")
-            except Exception as e:
-                messagebox.showerror("エラー", f"累積リスト読み込み失敗:\n{e}")
-                root.destroy()
-                return
+    if existing_path:
+        try:
+            existing_df = load_file_flexible(existing_path)
+            existing_df = clean_jan_codes(existing_df)
+            # データソースは種類が少ないのでカテゴリ型にする（判定・集計が種類数ぶんで済み、メモリも減る）
+            source_col = INTERNAL_COLUMNS['source']
+            if source_col in existing_df.columns:
+                existing_df[source_col] = existing_df[source_col].astype('category')
+            print(f"✅ 累積リスト読み込み: {len(existing_df)}件")
+        except Exception as e:
+            messagebox.showerror("エラー", f"累積リスト読み込み失敗:\n{e}")
+            return
     else:
         print("📂 新規作成モード")
     
-    root.destroy()
-    
     # ========== ステップ2: マッチング結果読み込み ==========
     print("\n【ステップ2】マッチング結果の読み込み")
     
-    root = tk.Tk()
-    root.withdraw()
-    
-    messagebox.showinfo("選択", "今週のマッチング結果ファイルを選択してください")
-    
-    matching_path = filedialog.askopenfilename(
-        title="マッチング結果を選択",
-        filetypes=[("Excel/CSV", "*.xlsx *.csv *.tsv"), ("すべて", "*.*")]
-    )
-    
-    root.destroy()
-    
-    if not matching_path:
-        messagebox.showwarning("キャンセル", "マッチング結果が選択されませんでした")
-        return
+    matching_path = inputs['matching_path']
     
     try:
         matching_df = load_file_flexible(matching_path)
         matching_df = normalize_matching(matching_df, Path(matching_path).name)
-        matching_df = clean_jan_codes(matching_df)
         print(f"✅ マッチング結果読み込み: {len(matching_df)}件")
     except Exception as e:
         messagebox.showerror("エラー", f"マッチング結果読み込み失敗:\n{e}")
@@ -416,38 +634,16 @@ def main():
     # ========== ステップ3: 花王・プラネット差し替えリスト読み込み ==========
     print("\n【ステップ3】花王・プラネット差し替えリストの読み込み")
     
-    root = tk.Tk()
-    root.withdraw()
-    
     kao_planet_df = pd.DataFrame()
+    kao_planet_path = inputs['kao_planet_path']
     
-    choice = messagebox.askquestion(
-        "花王・プラネット", 
-        "今週、花王・プラネットの差し替えリストを更新しますか？\n"
-        "（半年に1回程度）\n\n"
-        "「はい」→ 新しいファイルを読み込み、古いデータを削除\n"
-        "「いいえ」→ スキップ（マッチングのみ統合）"
-    )
-    
-    if choice == 'yes':
-        # 期間入力
-        period = simpledialog.askstring(
-            "期間入力",
-            "花王・プラネットの期間を入力してください\n（例: 25年上、25年下）",
-            initialvalue="25年上"
-        )
+    if kao_planet_path:
+        period = inputs['period']
         
         if not period:
             period = datetime.now().strftime('%Y年')
         
-        # 保持する期間を入力
-        keep_periods_str = simpledialog.askstring(
-            "保持期間",
-            "累積から保持する期間をカンマ区切りで入力\n（例: 24年下,25年上）\n\n"
-            "※古い期間のデータは削除されます\n"
-            "※空欄で全削除してから新規追加",
-            initialvalue="24年下,25年上"
-        )
+        keep_periods_str = inputs['keep_periods']
         
         if keep_periods_str:
             periods_to_keep = [p.strip() for p in keep_periods_str.split(',')]
@@ -458,45 +654,22 @@ def main():
         existing_df = remove_old_kao_planet(existing_df, periods_to_keep)
         
         # 新しい花王・プラネットファイルを読み込み
-        kao_planet_path = filedialog.askopenfilename(
-            title="花王・プラネット差し替えリストを選択",
-            filetypes=[("Excel/CSV", "*.xlsx *.csv"), ("すべて", "*.*")]
-        )
-        
-        if kao_planet_path:
-            try:
-                kao_planet_df = load_file_flexible(kao_planet_path)
-                kao_planet_df = normalize_kao_planet(
-                    kao_planet_df, 
-                    Path(kao_planet_path).name,
-                    period
-                )
-                kao_planet_df = clean_jan_codes(kao_planet_df)
-                print(f"✅ 花王・プラネット読み込み: {len(kao_planet_df)}件")
-            except Exception as e:
-                messagebox.showerror("エラー", f"花王・プラネット読み込み失敗:\n{e}")
-                root.destroy()
-                return
+        try:
+            kao_planet_df = load_file_flexible(kao_planet_path)
+            kao_planet_df = normalize_kao_planet(
+                kao_planet_df, 
+                Path(kao_planet_path).name,
+                period
+            )
+            print(f"✅ 花王・プラネット読み込み: {len(kao_planet_df)}件")
+        except Exception as e:
+            messagebox.showerror("エラー", f"花王・プラネット読み込み失敗:\n{e}")
+            return
     else:
         print("📂 花王・プラネットなし（マッチングのみ統合）")
     
-    root.destroy()
-    
-    # ========== ステップ4: 出力先選択 ==========
-    print("\n【ステップ4】出力先の選択")
-    
-    root = tk.Tk()
-    root.withdraw()
-    
-    output_dir = filedialog.askdirectory(title="保存先フォルダを選択")
-    
-    root.destroy()
-    
-    if not output_dir:
-        messagebox.showwarning("キャンセル", "保存先が選択されませんでした")
-        return
-    
-    output_dir = Path(output_dir)
+    # ========== ステップ4: 出力先 ==========
+    output_dir = Path(inputs['output_dir'])
     
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     output_csv = output_dir / f"累積_差し替えリスト_{timestamp}.csv"
@@ -514,12 +687,20 @@ def main():
     
     try:
         print(f"💾 CSV保存中（cp932）: {output_csv.name}")
-        final_df.to_csv(output_csv, index=False, encoding='cp932', errors='replace')
-        final_df.to_csv(latest_csv, index=False, encoding='cp932', errors='replace')
-        
         print(f"💾 Excel保存中: {output_excel.name}")
-        final_df.to_excel(output_excel, index=False, engine='openpyxl')
-        final_df.to_excel(latest_excel, index=False, engine='openpyxl')
+        
+        # CSVとExcelは互いに関係ないので、別スレッドで並行して書き出す
+        # （書き出し中のファイルI/OやC++実装のCSVライターの処理が、もう一方と重なる）
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            csv_future = executor.submit(write_csv_cp932, final_df, output_csv)
+            excel_future = executor.submit(write_excel, final_df, output_excel)
+            csv_future.result()
+            excel_future.result()
+        
+        # 「_最新」は中身が同じなので、書き出し直さずにファイルをコピー
+        # （ハードリンクだと「_最新」を編集したときに日付付きの控えまで変わってしまうため、コピーにする）
+        shutil.copyfile(output_csv, latest_csv)
+        shutil.copyfile(output_excel, latest_excel)
         
         print("✅ 保存完了")
     except Exception as e:
@@ -527,8 +708,12 @@ def main():
         return
     
     # ========== 完了メッセージ ==========
-    source_col = UNIFIED_COLUMNS['source']
-    source_counts = final_df[source_col].value_counts().to_dict() if source_col in final_df.columns else {}
+    source_col = INTERNAL_COLUMNS['source']
+    source_counts = {}
+    if source_col in final_df.columns:
+        counts = final_df[source_col].value_counts()
+        # カテゴリ型のままの場合は件数0の種類も数えられるので除く
+        source_counts = counts[counts > 0].to_dict()
     
     summary = f"""
 🎉 統合処理完了！